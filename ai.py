@@ -1,219 +1,118 @@
-from openai import OpenAI
 from dataclasses import dataclass
-import time
+import asyncio
+import json
 import re
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import os
-from web_drivers import web_driver
+import threading
+import rating_cache
+import metrics
+from rate_limiter import limiter
+from detail_scripts import DETAIL_SCRIPTS
+import page_state
+import prompts
+
+# Rating requests in flight at once (the pipeline's default rating worker count and rate_many's
+# limit) and the per-request timeout for the async client
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+
+# Listings rated per LLM request: 1 sends one request per listing, a number batches up to that
+# many (capped by what fits in LLM_CONTEXT_TOKENS), 'auto' fits as many as the context allows
+RATING_BATCH_SIZE = os.getenv('RATING_BATCH_SIZE', '1').lower()
+LLM_CONTEXT_TOKENS = int(os.getenv('LLM_CONTEXT_TOKENS', '8192'))
+MAX_RATING_BATCH_SIZE = 20
+
+# Tokens reserved for each listing's rating and reasoning in a batch reply
+BATCH_REPLY_TOKENS = 300
+
+# Extra requests made for listings missing from a batch reply
+RATING_BATCH_RETRIES = 1
+
+# 'http' reads detail pages' embedded ad data over plain HTTP and only opens a browser
+# when it's missing, 'browser' always scrapes the rendered page
+FETCH_MODE = os.getenv('FETCH_MODE', 'http').lower()
+
+_rating_cache = None
+_rating_cache_lock = threading.Lock()
 
 @dataclass
 class Preferences:
     description: str
 
+# openai and Selenium take most of the startup time, so they're imported where they're used
+
 def get_llm():
+    from openai import OpenAI
+
     client = OpenAI(
         base_url=os.getenv('LM_STUDIO_URL'),
         api_key=os.getenv('LM_STUDIO_API_KEY')
     )
     return client
 
+def get_async_llm():
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(
+        base_url=os.getenv('LM_STUDIO_URL'),
+        api_key=os.getenv('LM_STUDIO_API_KEY')
+    )
+    return client
+
 def scrape_detailed_data(url: str) -> dict:
+    site = next((name for name in ('storia', 'olx', 'autovit') if f'{name}.ro' in url), 'other')
+    # Wait for the host's rate limit before a browser is taken from the pool
+    limiter.wait(url)
+    with metrics.timer('detail_scrape', site=site):
+        if FETCH_MODE == 'http' and site in page_state.DETAIL_ADAPTERS:
+            details = _fetch_page_state_details(url, site)
+            if details:
+                return details
+            print("No embedded ad data in HTTP response, falling back to the browser...")
+            limiter.wait(url)
+        return _scrape_detailed_data(url)
+
+def _fetch_page_state_details(url, site):
+    from web_drivers import http_session
+
+    html = http_session.fetch_html(url)
+    if not html:
+        return None
+    with metrics.timer('parse', parser='state', site=site):
+        return page_state.parse_details(site, html)
+
+def _scrape_detailed_data(url: str) -> dict:
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from web_drivers import web_driver
+    from web_drivers.waits import TimedWait
+
     try:
-        if 'storia.ro' in url:
-            print("\nScraping from Storia...")
-            driver = web_driver.get_driver()
-            try:
-                driver.get(url)
-                # Wait for the description element to be present
-                wait = WebDriverWait(driver, 10)
-                description_element = wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, '[data-cy="adPageAdDescription"] span'))
-                )
-                description_text = description_element.text
-                
-            finally:
-                driver.quit()
-                
-        elif 'olx.ro' in url:  # OLX
-            print("Scraping from OLX...")
-            driver = web_driver.get_driver()
-            try:
-                driver.get(url)
-                wait = WebDriverWait(driver, 10)
-                
-                description_element = wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, '[data-cy="ad_description"] div.css-19duwlz'))
-                )
-                description_text = description_element.text
-                
-                parameters = {}
-                
-                try:
-                    seller_element = wait.until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, '[data-testid="ad-parameters-container"] p.css-1los5bp'))
-                    )
-                    parameters['seller_type'] = seller_element.text
-                except:
-                    parameters['seller_type'] = 'Unknown'
-                
-                try:
-                    params_container = wait.until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, '[data-testid="ad-parameters-container"]'))
-                    )
-                    param_elements = params_container.find_elements(By.CSS_SELECTOR, 'p.css-1los5bp')
-                    
-                    for param in param_elements:
-                        text = param.text.strip()
-                        if ':' in text:
-                            key, value = text.split(':', 1)
-                            parameters[key.strip()] = value.strip()
-                        else:
-                            # Handle cases without colon (like "Persoana fizica")
-                            parameters[text] = True
-                except:
-                    pass
-                
-                features = {}
-                try:
-                    feature_sections = wait.until(
-                        EC.presence_of_all_elements_located((By.CSS_SELECTOR, '[data-testid="ad-features"]'))
-                    )
-                    for section in feature_sections:
-                        try:
-                            section_name = section.find_element(By.CSS_SELECTOR, 'h3').text
-                            feature_elements = section.find_elements(By.CSS_SELECTOR, 'li')
-                            section_features = [feature.text for feature in feature_elements]
-                            
-                            if section_features:
-                                features[section_name] = section_features
-                        except:
-                            continue
-                except:
-                    pass
-                
-                if features:
-                    parameters['Features'] = features
-                
-            finally:
-                driver.quit()
-                
-        elif 'autovit.ro' in url:  # Autovit
-            print("Scraping from Autovit...")
-            driver = web_driver.get_driver()
-            try:
-                driver.get(url)
-                wait = WebDriverWait(driver, 10)
-                
-                description_element = wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, '[data-testid="textWrapper"]'))
-                )
-                description_text = wait.until(
-                    lambda d: description_element.text if description_element.is_displayed() else ""
-                )
-                
-                parameters = {}
-                
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        seller_element = wait.until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, '.ooa-70qvj9 .ooa-1hl3hwd'))
-                        )
-                        parameters['seller_type'] = seller_element.text
-                        break
-                    except:
-                        if attempt == max_retries - 1:
-                            parameters['seller_type'] = 'Unknown'
-                
-                try:
-                    basic_info = wait.until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, '[data-testid="basic_information"]'))
-                    )
-                    info_elements = basic_info.find_elements(By.CSS_SELECTOR, '[data-testid]')
-                    for element in info_elements:
-                        try:
-                            label = wait.until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, '.eur4qwl8'))
-                            ).text
-                            value = wait.until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, '.eur4qwl9'))
-                            ).text
-                            parameters[label] = value
-                        except:
-                            continue
-                except:
-                    pass
-                
-                try:
-                    tech_specs = wait.until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, '[data-testid="collapsible-groups-wrapper"]'))
-                    )
-                    spec_elements = tech_specs.find_elements(By.CSS_SELECTOR, '[data-testid]')
-                    for element in spec_elements:
-                        try:
-                            label = wait.until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, '.eur4qwl8'))
-                            ).text
-                            value = wait.until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, '.eur4qwl9'))
-                            ).text
-                            parameters[label] = value
-                        except:
-                            continue
-                except:
-                    pass
-                
-                features = {}
-                try:
-                    feature_sections = wait.until(
-                        EC.presence_of_all_elements_located((By.CSS_SELECTOR, '.ooa-xve46n button'))
-                    )
-                    for section in feature_sections:
-                        try:
-                            # Get section name
-                            section_name = wait.until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, '.e1jq34to3'))
-                            ).text
-                            
-                            # Click to expand section if needed
-                            if section.get_attribute('aria-expanded') == 'false':
-                                driver.execute_script("arguments[0].click();", section)
-                                time.sleep(0.5)  # Wait for animation
-                            
-                            # Get features in this section
-                            section_features = []
-                            feature_elements = wait.until(
-                                EC.presence_of_all_elements_located((By.XPATH, "following-sibling::div//p[contains(@class, 'e1jq34to3')]"))
-                            )
-                            for feature in feature_elements:
-                                section_features.append(feature.text)
-                            
-                            if section_features:
-                                features[section_name] = section_features
-                        except:
-                            continue
-                except:
-                    pass
-                
-                if features:
-                    parameters['Dotari'] = features
-                
-            finally:
-                driver.quit()
-                
-        else:
+        site = next((name for name in DETAIL_SCRIPTS if f'{name}.ro' in url), None)
+        if site is None:
             print(f"Unsupported website: {url}")
-            description_text = ""
-            parameters = {}
-        
-        details = {
-            'description': description_text,
-            'parameters': parameters
+            return {
+                'description': "",
+                'parameters': {}
+            }
+
+        print(f"Scraping from {site.capitalize()}...")
+        extractor = DETAIL_SCRIPTS[site]
+        with web_driver.get_pool().driver() as driver:
+            with metrics.timer('page_load', site=site):
+                driver.get(url)
+
+            # One readiness wait, then the whole page is read by a single injected script
+            TimedWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, extractor.ready))
+            )
+            with metrics.timer('detail_extract', site=site):
+                details = driver.execute_async_script(extractor.script)
+
+        return {
+            'description': details.get('description') or "",
+            'parameters': details.get('parameters') or {}
         }
-        
-        return details
             
     except Exception as e:
         print(f"Error scraping {url}: {str(e)}")
@@ -221,124 +120,328 @@ def scrape_detailed_data(url: str) -> dict:
         print("Full error:", traceback.format_exc())
         return None
 
-def calculate_rating(listing, details: dict, preferences: Preferences, llm):
-    # Define the rating tool
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "rate_car",
-                "description": "Rates a car listing based on user preferences and provides reasoning",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "rating": {
-                            "type": "number",
-                            "description": "Rating from 0 to 10, where 10 is a perfect match"
-                        },
-                        "reasoning": {
-                            "type": "string",
-                            "description": "Detailed explanation of why the car was rated this way, including specific details about the car's condition, features, and how it matches the requirements"
-                        }
+# Rating tool, kept identical between requests so it stays part of the cached prompt prefix
+RATING_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "rate_car",
+            "description": "Rates a car listing based on user preferences and provides reasoning",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "rating": {
+                        "type": "number",
+                        "description": "Rating from 0 to 10, where 10 is a perfect match"
                     },
-                    "required": ["rating", "reasoning"]
-                }
+                    "reasoning": {
+                        "type": "string",
+                        "description": "Detailed explanation of why the car was rated this way, including specific details about the car's condition, features, and how it matches the requirements"
+                    }
+                },
+                "required": ["rating", "reasoning"]
+            }
+        }
+    }
+]
+
+# Batch variant, one call returns a rating for every listing in the request
+BATCH_RATING_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "rate_cars",
+            "description": "Rates several car listings based on user preferences and provides reasoning for each",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "ratings": {
+                        "type": "array",
+                        "description": "One entry per car in the request",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "ad_id": {
+                                    "type": "integer",
+                                    "description": "The ad_id shown above the car"
+                                },
+                                "rating": {
+                                    "type": "number",
+                                    "description": "Rating from 0 to 10, where 10 is a perfect match"
+                                },
+                                "reasoning": {
+                                    "type": "string",
+                                    "description": "Detailed explanation of why the car was rated this way, including specific details about the car's condition, features, and how it matches the requirements"
+                                }
+                            },
+                            "required": ["ad_id", "rating", "reasoning"]
+                        }
+                    }
+                },
+                "required": ["ratings"]
             }
         }
-    ]
+    }
+]
+
+def build_rating_request(listing, details: dict, preferences: Preferences) -> dict:
+    # Static instructions and preferences first, the listing last, see prompts.py
+    return _rating_request(preferences, _listing_prompt(listing, details), RATING_TOOLS, 500)
+
+def _listing_prompt(listing, details):
+    listing_prompt, prompt_tokens, truncated = prompts.build_listing_prompt(listing, details)
+    metrics.increment('prompt_tokens_estimated', prompt_tokens)
+    if truncated:
+        metrics.increment('prompt_truncations')
+        print(f"Prompt for {listing['title']} trimmed to ~{prompt_tokens} tokens")
+    return listing_prompt
+
+def _rating_request(preferences, user_prompt, tools, max_tokens):
+    return {
+        "model": os.getenv('LM_STUDIO_MODEL'),
+        "messages": [
+            {"role": "system", "content": prompts.build_system_prompt(preferences.description)},
+            {"role": "user", "content": user_prompt}
+        ],
+        "tools": tools,
+        "tool_choice": "required",  # Force the use of tools
+        "temperature": 0.4,
+        "max_tokens": max_tokens,  # Reduced max tokens to prevent excessive generation
+    }
+
+def rating_batch_size(preferences: Preferences, setting=RATING_BATCH_SIZE, context_tokens=LLM_CONTEXT_TOKENS) -> int:
+    # How many listings fit in one request next to the system prompt and tool schema
+    overhead = prompts.estimate_tokens(prompts.build_system_prompt(preferences.description) + json.dumps(BATCH_RATING_TOOLS))
+    per_listing = prompts.PROMPT_TOKEN_BUDGET + BATCH_REPLY_TOKENS
+    fits = max(1, (context_tokens - overhead) // per_listing)
+    if setting == 'auto':
+        return min(fits, MAX_RATING_BATCH_SIZE)
+    return max(1, min(int(setting), fits, MAX_RATING_BATCH_SIZE))
+
+def parse_rating_completion(completion):
+    # Check if we got a response with tool calls
+    if not completion.choices[0].message.tool_calls:
+        print("Warning: AI did not return a tool call, falling back to text response")
+        # Fall back to parsing the text response
+        response_text = completion.choices[0].message.content.strip()
+        rating_pattern = re.search(r'Rating:\s*(\d+(?:\.\d+)?)', response_text)
+        reasoning_pattern = re.search(r'Reasoning:\s*(.*)', response_text)
+        
+        if rating_pattern and reasoning_pattern:
+            rating = float(rating_pattern.group(1))
+            reasoning = reasoning_pattern.group(1)
+            return min(max(rating, 0), 10), reasoning
+        return 0, "Failed to parse AI response"
+        
+    # Process all tool calls
+    ratings_with_reasonings = []
     
-    # Extract car-specific information from the listing
-    age = listing[7] if len(listing) > 7 else None
-    kilometers = listing[8] if len(listing) > 8 else None
+    for tool_call in completion.choices[0].message.tool_calls:
+        if tool_call.function.name == "rate_car":
+            try:
+                # Parse the arguments from the tool call
+                args = json.loads(tool_call.function.arguments)
+                rating = float(args["rating"])
+                reasoning = args["reasoning"]
+                
+                # Ensure rating is within bounds
+                rating = min(max(rating, 0), 10)
+                ratings_with_reasonings.append((rating, reasoning))
+            except (KeyError, ValueError, TypeError) as e:
+                print(f"Error parsing tool call arguments: {e}")
+                continue
     
-    # Format additional parameters for the prompt
-    params_text = ""
-    if 'parameters' in details and details['parameters']:
-        params_text = "\nAdditional Parameters:\n"
-        for key, value in details['parameters'].items():
-            if isinstance(value, bool):
-                params_text += f"- {key}\n"
-            else:
-                params_text += f"- {key}: {value}\n"
+    return summarize_ratings(ratings_with_reasonings)
+
+def summarize_ratings(ratings_with_reasonings):
+    if not ratings_with_reasonings:
+        return 0, "No valid ratings were provided"
+        
+    # Sort by rating to find highest and lowest
+    ratings_with_reasonings.sort(key=lambda x: x[0])
     
-    user_prompt = f"""Rate this car from 0 to 10 based on these requirements:
-    {preferences.description}
-
-    Car details:
-    Title: {listing[0]}
-    Price: {listing[2]} EUR
-    Location: {listing[4]}
-    Age: {age} years
-    Kilometers: {kilometers} km
-    {params_text}
+    # Calculate average rating using all ratings
+    avg_rating = round(sum(r[0] for r in ratings_with_reasonings) / len(ratings_with_reasonings), 2)
     
-    Additional description:
-    {details['description']}
+    # Get highest and lowest rated reasonings
+    lowest_rated = f"Rated: {ratings_with_reasonings[0][0]}/10: {ratings_with_reasonings[0][1]}"
+    highest_rated = f"Rated: {ratings_with_reasonings[-1][0]}/10: {ratings_with_reasonings[-1][1]}"
     
-    Please provide unique perspectives in your reasoning, focusing on different aspects of the car.
-    """
+    print(f"Received {len(ratings_with_reasonings)} ratings, averaging to {avg_rating:.2f}")
+    return avg_rating, lowest_rated, highest_rated
+
+def get_rating_cache(create=True):
+    # Without create, only a cache that's already open is returned
+    global _rating_cache
+    if not rating_cache.LLM_CACHE_ENABLED:
+        return None
+    with _rating_cache_lock:
+        if _rating_cache is None and create:
+            _rating_cache = rating_cache.RatingCache()
+        return _rating_cache
+
+def _lookup_cached_rating(request: dict):
+    cache = get_rating_cache()
+    if cache is None:
+        return None, None
+
+    key = cache.make_key(request)
+    cached = cache.get(key)
+    if cached:
+        print("Using cached rating for identical prompt")
+        metrics.increment('llm_cache_hits')
+    else:
+        metrics.increment('llm_cache_misses')
+    return key, cached
+
+def _record_usage(completion):
+    usage = getattr(completion, 'usage', None)
+    if usage:
+        metrics.increment('llm_prompt_tokens', usage.prompt_tokens or 0)
+        metrics.increment('llm_completion_tokens', usage.completion_tokens or 0)
+        # Servers that report prefix cache reuse say how much of the prompt skipped prefill
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', None) or 0
+        metrics.increment('llm_cached_prompt_tokens', cached_tokens)
+        print(f"Prompt tokens: {usage.prompt_tokens} ({cached_tokens} cached), completion tokens: {usage.completion_tokens}")
+
+def _store_rating(key, result):
+    # Only successful ratings are cached, errors should be retried next time
+    if key and len(result) == 3:
+        get_rating_cache().put(key, result)
+
+def calculate_rating(listing, details: dict, preferences: Preferences, llm):
+    request = build_rating_request(listing, details, preferences)
+    cache_key, cached = _lookup_cached_rating(request)
+    if cached:
+        return cached
 
     try:
-        completion = llm.chat.completions.create(
-            model=os.getenv('LM_STUDIO_MODEL'),
-            messages=[
-                {"role": "system", "content": "You are an AI that rates car listings based on user preferences. Each rating should provide a unique perspective, focusing on different aspects of the car."},
-                {"role": "user", "content": user_prompt}
-            ],
-            tools=tools,
-            tool_choice="required",  # Force the use of tools
-            temperature=0.4,
-            max_tokens=500,  # Reduced max tokens to prevent excessive generation
-        )
-        
-        # Check if we got a response with tool calls
-        if not completion.choices[0].message.tool_calls:
-            print("Warning: AI did not return a tool call, falling back to text response")
-            # Fall back to parsing the text response
-            response_text = completion.choices[0].message.content.strip()
-            rating_pattern = re.search(r'Rating:\s*(\d+(?:\.\d+)?)', response_text)
-            reasoning_pattern = re.search(r'Reasoning:\s*(.*)', response_text)
-            
-            if rating_pattern and reasoning_pattern:
-                rating = float(rating_pattern.group(1))
-                reasoning = reasoning_pattern.group(1)
-                return min(max(rating, 0), 10), reasoning
-            return 0, "Failed to parse AI response"
-            
-        # Process all tool calls
-        ratings_with_reasonings = []
-        
-        for tool_call in completion.choices[0].message.tool_calls:
-            if tool_call.function.name == "rate_car":
-                try:
-                    # Parse the arguments from the tool call
-                    args = eval(tool_call.function.arguments)
-                    rating = float(args["rating"])
-                    reasoning = args["reasoning"]
-                    
-                    # Ensure rating is within bounds
-                    rating = min(max(rating, 0), 10)
-                    ratings_with_reasonings.append((rating, reasoning))
-                except (KeyError, ValueError, SyntaxError) as e:
-                    print(f"Error parsing tool call arguments: {e}")
-                    continue
-        
-        if not ratings_with_reasonings:
-            return 0, "No valid ratings were provided"
-            
-        # Sort by rating to find highest and lowest
-        ratings_with_reasonings.sort(key=lambda x: x[0])
-        
-        # Calculate average rating using all ratings
-        avg_rating = round(sum(r[0] for r in ratings_with_reasonings) / len(ratings_with_reasonings), 2)
-        
-        # Get highest and lowest rated reasonings
-        lowest_rated = f"Rated: {ratings_with_reasonings[0][0]}/10: {ratings_with_reasonings[0][1]}"
-        highest_rated = f"Rated: {ratings_with_reasonings[-1][0]}/10: {ratings_with_reasonings[-1][1]}"
-        
-        print(f"Received {len(ratings_with_reasonings)} ratings, averaging to {avg_rating:.2f}")
-        return avg_rating, lowest_rated, highest_rated
+        with metrics.timer('llm_request'):
+            completion = llm.chat.completions.create(**request)
+        _record_usage(completion)
+        result = parse_rating_completion(completion)
+        _store_rating(cache_key, result)
+        return result
             
     except Exception as e:
         print(f"Error getting rating: {e}")
         return 0, f"Error: {str(e)}"
+
+def parse_batch_completion(completion) -> dict:
+    # Returns {ad_id: [(rating, reasoning), ...]} from every rate_cars call in the reply
+    ratings = {}
+    for tool_call in completion.choices[0].message.tool_calls or []:
+        if tool_call.function.name != "rate_cars":
+            continue
+        try:
+            args = json.loads(tool_call.function.arguments)
+        except ValueError as e:
+            print(f"Error parsing tool call arguments: {e}")
+            continue
+
+        for entry in args.get("ratings") or []:
+            try:
+                ad_id = int(entry["ad_id"])
+                rating = min(max(float(entry["rating"]), 0), 10)
+                ratings.setdefault(ad_id, []).append((rating, entry["reasoning"]))
+            except (KeyError, ValueError, TypeError) as e:
+                print(f"Error parsing batch rating entry: {e}")
+    return ratings
+
+def calculate_ratings(items, preferences: Preferences, llm, retries: int = RATING_BATCH_RETRIES):
+    # Rates a list of (listing, details) pairs with one request for the whole batch and
+    # returns their results in the same order. Listings the reply leaves out are sent
+    # again on their own batch, up to retries times.
+    listing_prompts = [_listing_prompt(listing, details) for listing, details in items]
+    results = [None] * len(items)
+
+    # Cached per listing under the single-listing request, so batch and single runs share it
+    cache_keys = [None] * len(items)
+    pending = []
+    for index, listing_prompt in enumerate(listing_prompts):
+        cache_keys[index], cached = _lookup_cached_rating(_rating_request(preferences, listing_prompt, RATING_TOOLS, 500))
+        if cached:
+            results[index] = cached
+        else:
+            pending.append(index)
+
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying {len(pending)} listings missing from the batch reply")
+
+        # ad_ids are positions within this request, short numbers are easier for the model to copy
+        entries = [(ad_id, listing_prompts[index]) for ad_id, index in enumerate(pending, 1)]
+        request = _rating_request(preferences, prompts.build_batch_prompt(entries), BATCH_RATING_TOOLS,
+                                  BATCH_REPLY_TOKENS * len(entries))
+        try:
+            with metrics.timer('llm_request', batch=str(len(entries))):
+                completion = llm.chat.completions.create(**request)
+            _record_usage(completion)
+            returned = parse_batch_completion(completion)
+        except Exception as e:
+            print(f"Error getting batch rating: {e}")
+            returned = {}
+
+        unexpected = set(returned) - {ad_id for ad_id, _ in entries}
+        if unexpected:
+            print(f"Ignoring ratings for unknown ad_ids: {sorted(unexpected)}")
+
+        missing = []
+        for ad_id, index in enumerate(pending, 1):
+            if ad_id in returned:
+                results[index] = summarize_ratings(returned[ad_id])
+                _store_rating(cache_keys[index], results[index])
+            else:
+                missing.append(index)
+        metrics.increment('llm_batch_missing', len(missing))
+        pending = missing
+
+    for index in pending:
+        results[index] = (0, "Error: rating missing from batch reply")
+    return results
+
+async def calculate_rating_async(listing, details: dict, preferences: Preferences, llm, timeout: float = LLM_TIMEOUT):
+    request = build_rating_request(listing, details, preferences)
+    # The cache is SQLite, its reads and writes run in a thread so they don't hold up the other requests
+    cache_key, cached = await asyncio.to_thread(_lookup_cached_rating, request)
+    if cached:
+        return cached
+
+    try:
+        with metrics.timer('llm_request'):
+            completion = await asyncio.wait_for(llm.chat.completions.create(**request), timeout)
+        _record_usage(completion)
+        result = parse_rating_completion(completion)
+        await asyncio.to_thread(_store_rating, cache_key, result)
+        return result
+
+    except asyncio.TimeoutError:
+        print(f"Rating request timed out after {timeout}s")
+        return 0, f"Error: request timed out after {timeout}s"
+    except Exception as e:
+        print(f"Error getting rating: {e}")
+        return 0, f"Error: {str(e)}"
+
+async def rate_many(listings, details, preferences: Preferences, llm=None,
+                    max_concurrency: int = LLM_CONCURRENCY, timeout: float = LLM_TIMEOUT):
+    # Rates listings concurrently, keeping at most max_concurrency requests in
+    # flight, and yields (listing, result) pairs in completion order
+    llm = llm or get_async_llm()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def rate(listing, listing_details):
+        async with semaphore:
+            return listing, await calculate_rating_async(listing, listing_details, preferences, llm, timeout)
+
+    tasks = [asyncio.ensure_future(rate(listing, listing_details))
+             for listing, listing_details in zip(listings, details)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # Don't leave requests running if the caller stops iterating early
+        for task in tasks:
+            task.cancel()
@@ -1,19 +1,28 @@
-from bs4 import BeautifulSoup
+import argparse
 import db
-from datetime import datetime
-import ai  # Import the ai module
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import time as time_module
+import filters
+import listing_parser
+import metrics
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from web_drivers import web_driver
+from rate_limiter import limiter
+
+# Selenium, requests and openai (through ai and pipeline) are imported inside the functions
+# that use them, so --help and runs that never need a browser or the LLM start quickly
 
 # Load environment variables
 load_dotenv()
 
-conn, c = db.setup_db()
+# Opened on first use by get_db()
+conn, c = None, None
+
+def get_db():
+    global conn, c
+    if conn is None:
+        conn, c = db.setup_db()
+    return conn, c
 
 # Base URL without the page number
 base_url = os.getenv('BASE_URL')
@@ -21,298 +30,439 @@ base_url = os.getenv('BASE_URL')
 # Define the number of pages you want to scrape
 max_pages = int(os.getenv('MAX_PAGES', '5'))
 
+# Results pages fetched in parallel, requests are paced per host by the rate limiter
+scrape_workers = int(os.getenv('SCRAPE_WORKERS', '2'))
+
+# 'http' fetches results pages with a plain HTTP request and only falls back to
+# the browser when no listing cards come back, 'browser' always uses Selenium
+fetch_mode = os.getenv('FETCH_MODE', 'http').lower()
+
+# Incremental mode stops paginating once a page is entirely known, or after
+# INCREMENTAL_STOP_AFTER consecutive known cards (0 = only whole pages)
+incremental = os.getenv('INCREMENTAL', 'false').lower() == 'true'
+incremental_stop_after = int(os.getenv('INCREMENTAL_STOP_AFTER', '0'))
+
+# Price range of listings sent to the AI
+min_price = float(os.getenv('MIN_PRICE', '0'))
+max_price = float(os.getenv('MAX_PRICE', '100000'))
+
+def _optional_int(name):
+    value = os.getenv(name, '').strip()
+    return int(value) if value else None
+
+def _env_list(name):
+    return tuple(value.strip() for value in os.getenv(name, '').split(',') if value.strip())
+
+# Hard constraints, listings outside them are never scraped in detail or rated (empty = no limit)
+listing_filters = filters.ListingFilters(
+    min_price=min_price,
+    max_price=max_price,
+    min_year=_optional_int('MIN_YEAR'),
+    max_kilometers=_optional_int('MAX_KILOMETERS'),
+    min_horsepower=_optional_int('MIN_HORSEPOWER'),
+    fuel_types=_env_list('FUEL_TYPES'),
+    gearbox_types=_env_list('GEARBOX_TYPES'),
+)
+
 def wait_for_page_load(driver, timeout=30):
+    from selenium.webdriver.support.ui import WebDriverWait
+
     try:
-        # Wait for the page to be fully loaded
+        # Wait for the page to be loaded, the lean browser profile only waits for the DOM
         WebDriverWait(driver, timeout).until(
-            lambda d: d.execute_script('return document.readyState') == 'complete'
+            lambda d: d.execute_script('return document.readyState') in web_driver.READY_STATES
         )
         return True
     except Exception as e:
         print(f"Timeout waiting for page load: {str(e)}")
         return False
 
-def romanian_to_standard_date(romanian_date):
-    # Define Romanian month names and their numeric equivalents
-    romanian_months = {
-        'ianuarie': '01', 'februarie': '02', 'martie': '03', 'aprilie': '04',
-        'mai': '05', 'iunie': '06', 'iulie': '07', 'august': '08',
-        'septembrie': '09', 'octombrie': '10', 'noiembrie': '11', 'decembrie': '12'
-    }
-    
-    # Split the Romanian date into day, month name, and year
-    parts = romanian_date.split()
-    if len(parts) != 3:
-        raise ValueError("Date must be in the format 'dd month yyyy'")
-    
-    day, month_name, year = parts
-    
-    # Convert month name to numeric month
-    month = romanian_months.get(month_name.lower())
-    if not month:
-        raise ValueError(f"Unknown month: {month_name}")
-    
-    # Format the date in standard format
-    standard_date = f'{day}-{month}-{year} 00:00'
-    
-    return standard_date
-
-def scrape_listings():
-    driver = web_driver.get_driver()
+def load_results_page(driver, url):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from web_drivers.waits import TimedWait
+
+    with metrics.timer('page_load', site='results'):
+        # Load the page with Selenium
+        limiter.wait(url)
+        driver.get(url)
+        print("Page loaded, waiting for content...")
+
+        # Wait for the page to be fully loaded
+        if not wait_for_page_load(driver):
+            print("Page load timeout, trying to refresh...")
+            limiter.wait(url)
+            driver.refresh()
+            if not wait_for_page_load(driver):
+                print("Failed to load page after refresh, skipping...")
+                return None
+
+    # Try to find any element that indicates the page has loaded
+    page_loaded = False
+    for selector in [
+        '[data-cy="l-card"]',
+        '[data-testid="l-card"]',
+        '.css-l9drzq'
+    ]:
+        try:
+            element = TimedWait(driver, 15).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, selector))
+            )
+            if element:
+                page_loaded = True
+                break
+        except:
+            continue
+
+    if not page_loaded:
+        print("Could not find any content on the page, backing off...")
+        limiter.penalize(url)
+        return None
+
+    return driver.page_source
+
+def fetch_results_page(pool, url):
+    # Returns the page's listing cards, None if it couldn't be loaded
+    if fetch_mode == 'http':
+        from web_drivers import http_session
+
+        limiter.wait(url)
+        html = http_session.fetch_html(url)
+        # Judged by the cards actually parsed, consent and error pages can still mention the markers
+        cards = listing_parser.parse_listing_cards(html) if html else []
+        if cards:
+            return cards
+        print("No listing cards in HTTP response, falling back to the browser...")
+
+    with pool.driver() as driver:
+        page_source = load_results_page(driver, url)
+    if page_source is None:
+        return None
+    return listing_parser.parse_listing_cards(page_source)
+
+def page_url(page, search_url=None):
+    # Construct the URL for a results page, search_url defaults to BASE_URL
+    return (search_url or base_url) + str(page)
+
+def fetch_page_cards(pool, page, search_url=None):
+    # Runs on a scrape worker: fetch and parse one results page, None if it couldn't be loaded
+    print(f"Scraping page {page}...")
+
+    return fetch_results_page(pool, page_url(page, search_url))
+
+def scrape_listings(on_new_ad=None, run_id=None, done_pages=(), search_url=None, page_count=None,
+                    stop_at_known=None, writer=None, known_urls=None):
+    # Scrapes one search (BASE_URL and MAX_PAGES unless given) and returns the number of new ads.
+    # done_pages are URLs of results pages a resumed run already finished, they're skipped.
+    # The daemon passes its long-lived writer and known URL set so searches share them.
+    conn, c = get_db()
+    pool = web_driver.get_pool()
+    writer = writer or db.BatchWriter(conn)
+    page_count = page_count or max_pages
+    stop_at_known = incremental if stop_at_known is None else stop_at_known
+    total_new = 0
+
+    # Preload known URLs so duplicate checks don't hit the database for every card
+    if known_urls is None:
+        known_urls = db.load_known_urls(c)
+    consecutive_known = 0
+
+    # Pages are fetched by the workers, but their cards are deduplicated and written
+    # here in page order so incremental mode still stops at the right place
+    workers = max(1, scrape_workers)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scrape')
+    futures = {}
+    pages = [page for page in range(1, page_count + 1) if page_url(page, search_url) not in done_pages]
+    if len(pages) < page_count:
+        print(f"Skipping {page_count - len(pages)} results pages finished before the run was interrupted")
+    next_index = 0
     try:
         # Loop through each page
-        for page in range(1, max_pages + 1):
-            print(f"Scraping page {page}...")
+        for position, page in enumerate(pages):
+            # Keep up to scrape_workers pages in flight ahead of the one being processed
+            while next_index < min(len(pages), position + workers):
+                futures[pages[next_index]] = executor.submit(fetch_page_cards, pool, pages[next_index], search_url)
+                next_index += 1
 
-            # Construct the URL for the current page
-            url = base_url + str(page)
-            
             try:
-                # Load the page with Selenium
-                driver.get(url)
-                print("Page loaded, waiting for content...")
-                
-                # Wait for the page to be fully loaded
-                if not wait_for_page_load(driver):
-                    print("Page load timeout, trying to refresh...")
-                    driver.refresh()
-                    if not wait_for_page_load(driver):
-                        print("Failed to load page after refresh, skipping...")
-                        continue
-                
-                # Try to find any element that indicates the page has loaded
-                page_loaded = False
-                for selector in [
-                    '[data-cy="l-card"]',
-                    '[data-testid="l-card"]',
-                    '.css-l9drzq'
-                ]:
-                    try:
-                        element = WebDriverWait(driver, 15).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                        )
-                        if element:
-                            page_loaded = True
-                            break
-                    except:
-                        continue
-                
-                if not page_loaded:
-                    print("Could not find any content on the page, trying to refresh...")
-                    driver.refresh()
-                    time_module.sleep(10)
+                cards = futures.pop(page).result()
+                if cards is None:
+                    writer.record_job('page', page_url(page, search_url), 'scraped', run_id, error="page could not be loaded")
                     continue
-
-                # Get the page source and parse with BeautifulSoup
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                
-                # Try different selectors for ads
-                ads = []
-                for selector in [
-                    {'data-cy': 'l-card'},
-                    {'data-testid': 'l-card'},
-                    {'class': 'css-l9drzq'}
-                ]:
-                    ads = soup.find_all('div', selector)
-                    if ads:
-                        print(f"Found {len(ads)} ads with selector {selector}")
-                        break
-
-                if not ads:
+                if not cards:
                     print("No ads found on the page, might be blocked or page structure changed")
+                    writer.record_job('page', page_url(page, search_url), 'scraped', run_id, error="no ads found on the page")
                     continue
+                print(f"Found {len(cards)} ads")
 
-                # Process each ad
-                for ad in ads:
-                    try:
-                        # Get the title
-                        title = None
-                        title_element = ad.find('h4', class_='css-1g61gc2')
-                        if title_element:
-                            title = title_element.text.strip()
-
-                        if not title:
-                            print("Could not find title, skipping ad...")
-                            continue
+                # Process each ad, the page's rows are written together by the flush below
+                new_ads = []
+                reached_known = False
+                # Only a page with nothing but known ads means the rest was seen before, not one
+                # whose cards all failed or whose flush failed
+                all_known = True
+                with writer.deferred():
+                    for card in cards:
+                        try:
+                            # Check for duplicates, including ads seen earlier in this run
+                            if card.url in known_urls:
+                                print("Ad already exists in the database. Skipping...")
+                                consecutive_known += 1
+                                if stop_at_known and incremental_stop_after and consecutive_known >= incremental_stop_after:
+                                    reached_known = True
+                                    break
+                                continue
+                            known_urls.add(card.url)
+                            consecutive_known = 0
 
-                        # Get the price
-                        price = None
-                        price_element = ad.find('p', {'data-testid': 'ad-price'})
-                        if price_element:
-                            price = price_element.text.strip()
+                            # Print and store the data
+                            print(f"Title: {card.title}")
+                            print(f"URL: {card.url}")
+                            print(f"Price: {card.price} EUR")
+                            print(f"Negotiable: {card.negotiable}")
+                            print(f"Location: {card.location}")
+                            print(f"Date: {card.date}")
+                            print(f"Age: {card.age} years")
+                            print(f"Kilometers: {card.kilometers} km")
+                            print("-" * 40)
 
-                        if not price:
-                            print("Could not find price, skipping ad...")
+                            # Buffer the insert, it's written with the rest of the page
+                            listing = writer.insert_ad(card.title, card.url, card.price, card.negotiable, card.location, card.date,
+                                                       card.size, card.age, card.kilometers, card.listing_type,
+                                                       card.fuel, card.gearbox, card.horsepower, card.body_type, card.seller_type)
+                            if listing is None:
+                                # Stored by another process since the known URLs were loaded
+                                print("Ad already exists in the database. Skipping...")
+                                continue
+                            all_known = False
+                            new_ads.append(listing)
+                            writer.record_job('listing', listing['id'], 'scraped', run_id)
+                        
+                        except Exception as e:
+                            print(f"Error processing ad: {str(e)}")
+                            all_known = False
                             continue
 
-                        # Process price
-                        if "Prețul e negociabil" in price:
-                            price = price.replace("Prețul e negociabil", "").strip()
-                            negotiable = "Negotiable"
-                        else:
-                            negotiable = "Fix"
-
-                        price = price.replace(" ", "").replace("€", "").replace(",", ".")
-
-                        # Get the URL
-                        ad_url = None
-                        url_element = ad.find('a', class_='css-1tqlkj0')
-                        if url_element and 'href' in url_element.attrs:
-                            ad_url = url_element['href']
-                            if not ad_url.startswith('http'):
-                                ad_url = 'https://www.olx.ro' + ad_url
-
-                        if not ad_url:
-                            print("Could not find URL, skipping ad...")
-                            continue
+                    # The page is checkpointed in the same transaction as its ads
+                    writer.record_job('page', page_url(page, search_url), 'scraped', run_id)
+                try:
+                    writer.flush()
+                    print(f"Saved {len(new_ads)} new ads to database")
+                    total_new += len(new_ads)
+                except Exception as e:
+                    # The page isn't checkpointed either, so a resumed run scrapes it again
+                    print(f"Failed to save ads to database: {str(e)}")
+                    writer.discard()
+                    known_urls.difference_update(listing['url'] for listing in new_ads)
+                    new_ads = []
 
-                        # Get location and date
-                        location = "N/A"
-                        date_str = datetime.now().strftime("%d-%m-%Y 00:00")
-                        
-                        location_date_element = ad.find('p', {'data-testid': 'location-date'})
-                        if location_date_element:
-                            location_date = location_date_element.text.strip()
-                            parts = location_date.split(" - ")
-                            if len(parts) >= 2:
-                                location = parts[0].strip()
-                                date_str = parts[1].strip()
-                                date_str = date_str.replace("Reactualizat ", "")
-                                if "Azi la" in date_str:
-                                    date_str = date_str.replace("Azi la ", datetime.now().strftime("%d-%m-%Y "))
-                                else:
-                                    date_str = date_str.replace("la", "")
-                                    try:
-                                        date_str = romanian_to_standard_date(date_str)
-                                    except:
-                                        pass
-
-                        # Get car details
-                        age = None
-                        kilometers = None
-                        size = "N/A"
-                        listing_type = "car"
-
-                        # Try to find car details
-                        details_element = ad.find('span', class_='css-6as4g5')
-                        if details_element:
-                            details_text = details_element.text.strip()
-                            # Extract year and kilometers
-                            parts = details_text.split()
-                            if len(parts) >= 2:
-                                try:
-                                    # First part is the year
-                                    age = int(parts[0])
-                                    # Everything after the year until 'km' is the kilometers
-                                    km_text = ' '.join(parts[1:-1])  # Join all parts except the last 'km'
-                                    kilometers = int(km_text.replace(' ', '').replace('.', ''))
-                                except:
-                                    pass
-
-                        # Check for duplicates
-                        if db.is_duplicate_ad(c, ad_url):
-                            print("Ad already exists in the database. Skipping...")
-                            continue
+                # Hand the saved ads to the rating stages
+                if on_new_ad:
+                    for listing in new_ads:
+                        on_new_ad(listing)
 
-                        # Print and store the data
-                        print(f"Title: {title}")
-                        print(f"URL: {ad_url}")
-                        print(f"Price: {price} EUR")
-                        print(f"Negotiable: {negotiable}")
-                        print(f"Location: {location}")
-                        print(f"Date: {date_str}")
-                        print(f"Age: {age} years")
-                        print(f"Kilometers: {kilometers} km")
-                        print("-" * 40)
-
-                        # Insert into database and check result
-                        if db.insert_ad(c, title, ad_url, price, negotiable, location, date_str, size, age, kilometers, listing_type):
-                            print("Successfully saved to database")
-                        else:
-                            print("Failed to save to database")
-                        
-                    except Exception as e:
-                        print(f"Error processing ad: {str(e)}")
-                        continue
+                # In incremental mode everything past this point was seen by an earlier run
+                if stop_at_known and (reached_known or all_known):
+                    print(f"Reached already known listings on page {page}, stopping pagination")
+                    break
                     
             except Exception as e:
                 print(f"Error processing page {page}: {str(e)}")
+                writer.record_job('page', page_url(page, search_url), 'scraped', run_id, error=str(e))
                 continue
-                    
-            # Add a delay between pages
-            time_module.sleep(5)
             
     except Exception as e:
         print(f"Error during scraping: {str(e)}")
     finally:
-        # Commit any remaining changes and close the database connection
-        conn.commit()
-        driver.quit()
+        # Drop pages that were queued past the stopping point and wait for the running ones
+        for future in futures.values():
+            future.cancel()
+        executor.shutdown(wait=True)
+
+        # Write any remaining buffered ads
+        writer.flush()
+
+    return total_new
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape car listings and rate them with a local LLM")
+    parser.add_argument('command', nargs='?', default='run', choices=('run', 'scrape', 'worker', 'daemon'),
+                        help="run: scrape and rate (default), scrape: only scrape and queue listings for workers, "
+                             "worker: rate queued listings, several can run at once, "
+                             "daemon: keep polling the searches in SEARCHES_FILE (or BASE_URL) and rate new listings")
+    parser.add_argument('--metrics-json', default=os.getenv('METRICS_JSON'),
+                        help="write a JSON summary of per-stage timings and counters to this file")
+    parser.add_argument('--metrics-prom', default=os.getenv('METRICS_PROM'),
+                        help="write the metrics in Prometheus text format to this file")
+    parser.add_argument('--metrics-log', default=os.getenv('METRICS_LOG'),
+                        help="log every stage timing as a JSON line to this file")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="write a cProfile dump per stage to this directory")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the last run that didn't finish, skipping the results pages it already scraped")
+    parser.add_argument('--once', action='store_true',
+                        help="worker: exit when there is nothing left to claim instead of waiting for new listings")
+    return parser.parse_args()
 
 def main():
-    # Scrape listings first
-    scrape_listings()
-    
-    # Then use ai.py to rate the listings and save results to DB
-    print("\nStarting AI rating process...")
-    
+    args = parse_args()
+    metrics.configure_logging(args.metrics_log)
+    if args.profile:
+        metrics.registry.enable_profiling(args.profile)
+
+    try:
+        if args.command == 'worker':
+            work(once=args.once)
+        elif args.command == 'daemon':
+            daemon()
+        elif args.command == 'scrape':
+            scrape(resume=args.resume)
+        else:
+            run(resume=args.resume)
+    finally:
+        # Shut down the pooled browsers
+        web_driver.close_pool()
+        write_metrics(args)
+
+def write_metrics(args):
+    if args.metrics_json:
+        metrics.registry.write_json(args.metrics_json)
+        print(f"Metrics summary written to {args.metrics_json}")
+    if args.metrics_prom:
+        metrics.registry.write_prometheus(args.metrics_prom)
+        print(f"Prometheus metrics written to {args.metrics_prom}")
+    if args.profile:
+        metrics.registry.dump_profiles()
+
+def get_preferences():
+    import ai
+
     # Create preferences object
-    preferences = ai.Preferences(
+    return ai.Preferences(
         description=os.getenv('PREFERENCES')
     )
-    
-    # Get all listings from the database using db module
-    listings = db.load_listings_from_db()
-    
-    # Process listings with ai.py
-    llm = ai.get_llm()
-    
-    total_listings = len(listings)
-    processed_listings = 0
-    skipped_listings = 0
-    
-    for idx, listing in enumerate(listings, 1):
-        try:
-            # Check if the listing already has a rating
-            existing_rating = db.get_rating(c, listing[0])  # listing[0] is the ID
-            if existing_rating:
-                print(f"Listing {listing[0]} already has a rating of {existing_rating[0]}. Skipping...")
-                continue
-                
-            price = float(listing[3])  # Price is in the fourth column
-            if price < float(os.getenv('MIN_PRICE', '0')) or price > float(os.getenv('MAX_PRICE', '100000')):
-                skipped_listings += 1
-                continue
-                
-            processed_listings += 1
-            print(f"\nProcessing listing {processed_listings}/{total_listings} (Total skipped: {skipped_listings})")
-            url = listing[2]  # URL is in the third column
-            details = ai.scrape_detailed_data(url)
-            
-            if not details:
-                print(f"Skipping listing due to scraping issues: {url}")
+
+def run(resume=False):
+    import pipeline
+
+    preferences = get_preferences()
+
+    # Detail scraping and rating run in background stages while results pages are still being scraped,
+    # the LLM client is created once the first listing needs rating.
+    # Progress is checkpointed in the runs and jobs tables, --resume continues from there
+    conn, c = get_db()
+    try:
+        with db.tracked_run(conn, resume) as (run_id, done_pages):
+            rating_pipeline = pipeline.Pipeline(preferences, listing_filters=listing_filters, run_id=run_id)
+            rating_pipeline.start()
+
+            def queue_new_listing(listing):
+                # New listings are checked in memory, with the same rules the database query uses
+                if listing_filters.matches(listing):
+                    rating_pipeline.submit(listing)
+
+            try:
+                scrape_listings(on_new_ad=queue_new_listing, run_id=run_id, done_pages=done_pages)
+
+                # Then queue listings left unrated by earlier runs, except those that keep failing
+                print("\nQueueing unrated listings from the database...")
+                for listing in db.iter_unrated_listings(listing_filters):
+                    rating_pipeline.submit(listing)
+            finally:
+                rating_pipeline.close()
+    finally:
+        # Close the database connection
+        db.close_db(conn)
+
+def scrape(resume=False):
+    # Scrapes results pages only and leaves rating to queue workers
+    conn, c = get_db()
+    try:
+        with db.tracked_run(conn, resume) as (run_id, done_pages):
+            scrape_listings(run_id=run_id, done_pages=done_pages)
+            added = db.enqueue_unrated_listings(conn)
+            if added:
+                print(f"Queued {added} older unrated listings for the workers")
+    finally:
+        db.close_db(conn)
+
+def daemon():
+    import signal
+    import threading
+    import pipeline
+    import prefilter
+    import scheduler
+
+    searches = scheduler.load_searches(base_url, max_pages)
+    schedule = scheduler.Scheduler(searches)
+    print(f"Watching {len(searches)} searches: {', '.join(search.name for search in searches)}")
+    if prefilter.enabled():
+        print("The pre-filter needs every listing at once, the daemon rates listings without it")
+
+    # SIGTERM lets the current poll finish, then shuts down like Ctrl-C
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    # One writer, one set of known URLs (so an ad found by two searches is only stored and
+    # rated once) and one rating pipeline shared by every search, and one browser pool
+    conn, c = get_db()
+    writer = db.BatchWriter(conn)
+    known_urls = db.load_known_urls(c)
+    # Each listing is recorded under the poll that found it. Only the latest ids are
+    # remembered for dedupe, the known URL set already keeps searches from repeating ads.
+    rating_pipeline = pipeline.Pipeline(get_preferences(), listing_filters=listing_filters, use_prefilter=False,
+                                        dedupe_limit=scheduler.DAEMON_DEDUPE_LIMIT)
+    rating_pipeline.start()
+
+    def queue_new_listing(listing, run_id):
+        # Handed over without waiting, a poll takes as long as its scraping, not the ratings behind it
+        if listing_filters.matches(listing):
+            rating_pipeline.offer(listing, run_id)
+
+    def queue_backlog():
+        for listing in db.iter_unrated_listings(listing_filters):
+            if stop.is_set():
+                break
+            rating_pipeline.submit(listing)
+
+    # Listings left unrated by earlier runs are fed in the background, polling starts right away
+    backlog = threading.Thread(target=queue_backlog, name="backlog", daemon=True)
+    try:
+        backlog.start()
+
+        while not stop.is_set():
+            search, wait = schedule.next_due()
+            if wait > 0:
+                stop.wait(wait)
                 continue
-            
-            rating, lowest_rated, highest_rated = ai.calculate_rating(listing, details, preferences, llm)
-                
-            print(f"\nListing: {url}")
-            print(f"Title: {listing[1]}")  # Title is now in the second column
-            print(f"Price: {price} EUR")
-            print(f"Rating: {rating}/10")
-            print(f"Reasoning (Low): {lowest_rated}")
-            print(f"Reasoning (High): {highest_rated}")
-            print("-" * 50)
-            
-            # Save the rating to the database
-            db.save_rating(conn, c, listing[0], rating, lowest_rated, highest_rated)
-            
-        except (ValueError, TypeError) as e:
-            print(f"Error processing listing price: {e}")
-            skipped_listings += 1
-            continue
-    
-    # Close the database connection
-    db.close_db(conn)
+
+            search = schedule.pop()
+            print(f"\nPolling {search.name}...")
+            new_ads = 0
+            try:
+                with db.tracked_run(conn) as (run_id, _):
+                    # Stop at the first known ads, later pages were seen by an earlier poll
+                    new_ads = scrape_listings(on_new_ad=lambda listing: queue_new_listing(listing, run_id), run_id=run_id, search_url=search.url,
+                                              page_count=search.max_pages, stop_at_known=True,
+                                              writer=writer, known_urls=known_urls)
+            except Exception as e:
+                print(f"Error polling {search.name}: {str(e)}")
+
+            interval = search.record_poll(new_ads)
+            schedule.reschedule(search)
+            print(f"{search.name}: {new_ads} new ads, next poll in {interval / 60:.1f} minutes")
+    finally:
+        # Nothing may be submitted once the pipeline starts closing
+        stop.set()
+        if backlog.is_alive():
+            backlog.join()
+        rating_pipeline.close()
+        db.close_db(conn)
+
+def work(once=False):
+    import worker
+
+    worker.run_worker(get_preferences(), listing_filters, once=once)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,135 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+# Turns the free text scraped from cards and detail pages ("185.000 km", "105 CP",
+# "Benzina + GPL", "Azi la 14:30") into typed values for the advertisements columns.
+# Every parser returns None for values it doesn't understand.
+
+# Substrings checked in order, so "Benzina + GPL" is LPG rather than petrol
+FUELS = [
+    ('plug', 'plugin_hybrid'), ('hibrid', 'hybrid'), ('hybrid', 'hybrid'), ('electric', 'electric'),
+    ('gpl', 'petrol_lpg'), ('lpg', 'petrol_lpg'), ('cng', 'cng'), ('diesel', 'diesel'),
+    ('motorina', 'diesel'), ('benzin', 'petrol'), ('petrol', 'petrol'),
+]
+GEARBOXES = [('autom', 'automatic'), ('manual', 'manual')]
+SELLERS = [('fizica', 'private'), ('private', 'private'), ('firma', 'business'), ('business', 'business'), ('dealer', 'business')]
+
+# Detail page parameter labels (OLX and Autovit, without diacritics) and the column they fill
+DETAIL_LABELS = {
+    'an de fabricatie': 'age',
+    'anul productiei': 'age',
+    'rulaj': 'kilometers',
+    'km': 'kilometers',
+    'combustibil': 'fuel',
+    'cutie de viteze': 'gearbox',
+    'putere': 'horsepower',
+    'caroserie': 'body_type',
+    'tip caroserie': 'body_type',
+    'seller_type': 'seller_type',
+}
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+INPUT_DATE_FORMATS = ('%d-%m-%Y %H:%M', '%d-%m-%Y', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+def fold(value):
+    # Lowercase without diacritics, so "Automată" and "automata" compare equal
+    text = unicodedata.normalize('NFKD', str(value).casefold())
+    return ' '.join(''.join(ch for ch in text if not unicodedata.combining(ch)).split())
+
+def parse_number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r'[^0-9]', '', str(value))
+    return int(digits) if digits else None
+
+def parse_price(value):
+    # "3 500", "3.500" and "3500.50" (the card parser turns decimal commas into dots)
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    text = re.sub(r'[^0-9.,]', '', str(value)).replace(',', '.')
+    if re.fullmatch(r'\d{1,3}(\.\d{3})+', text):
+        text = text.replace('.', '')
+    try:
+        price = float(text)
+    except ValueError:
+        return None
+    return int(price) if price.is_integer() else price
+
+def parse_year(value):
+    match = re.search(r'\b(19|20)\d{2}\b', str(value)) if value is not None else None
+    return int(match.group()) if match else None
+
+def parse_horsepower(value):
+    if value is None or isinstance(value, bool):
+        return None
+    match = re.search(r'\d+', str(value).replace(' ', ''))
+    if not match:
+        return None
+    power = int(match.group())
+    return round(power * 1.36) if 'kw' in fold(value) else power
+
+def parse_date(value, now=None):
+    # Returns 'YYYY-MM-DD HH:MM', understanding the card parser's 'dd-mm-YYYY HH:MM' and
+    # OLX's relative "Azi la 14:30" / "Ieri la 14:30"
+    if not value:
+        return None
+    text = fold(value)
+    now = now or datetime.now()
+    for prefix, day in (('azi', now), ('ieri', now - timedelta(days=1))):
+        if text.startswith(prefix):
+            match = re.search(r'(\d{1,2}):(\d{2})', text)
+            hour, minute = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+            return day.replace(hour=hour, minute=minute).strftime(DATE_FORMAT)
+    for date_format in INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime(DATE_FORMAT)
+        except ValueError:
+            continue
+    return None
+
+def _lookup(value, table):
+    if value is None or isinstance(value, bool):
+        return None
+    text = fold(value)
+    if not text or text == 'unknown':
+        return None
+    return next((name for needle, name in table if needle in text), text)
+
+def normalize_fuel(value):
+    return _lookup(value, FUELS)
+
+def normalize_gearbox(value):
+    return _lookup(value, GEARBOXES)
+
+def normalize_seller(value):
+    return _lookup(value, SELLERS)
+
+def normalize_text(value):
+    return _lookup(value, ())
+
+# Column -> parser for the attributes read from cards and detail pages
+PARSERS = {
+    'age': parse_year,
+    'kilometers': parse_number,
+    'fuel': normalize_fuel,
+    'gearbox': normalize_gearbox,
+    'horsepower': parse_horsepower,
+    'body_type': normalize_text,
+    'seller_type': normalize_seller,
+}
+
+def details_attributes(details):
+    # Typed attributes found in a detail page's parameters, keyed by column
+    found = {}
+    for label, value in ((details or {}).get('parameters') or {}).items():
+        column = DETAIL_LABELS.get(fold(label))
+        if column and column not in found:
+            parsed = PARSERS[column](value)
+            if parsed is not None:
+                found[column] = parsed
+    return found
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import time
+from selenium.webdriver.support.ui import WebDriverWait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from web_drivers import web_driver
+
+# Compares the full and lean browser profiles on live pages: seconds until the page is
+# ready to read and bytes transferred. Needs a browser and network access.
+# Usage: python benchmarks/bench_browser_profile.py [url ...] [--rounds 3] [--settle 2]
+#
+# Bytes come from the Performance API, so cross-origin responses without a
+# Timing-Allow-Origin header count as 0 and blocked requests don't show up at all.
+
+TRANSFER_SCRIPT = """
+var entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return {
+    bytes: entries.reduce(function (total, entry) { return total + (entry.transferSize || 0); }, 0),
+    requests: entries.length
+};
+"""
+
+def load(driver, url, ready_states):
+    start = time.perf_counter()
+    driver.get(url)
+    WebDriverWait(driver, 30).until(lambda d: d.execute_script('return document.readyState') in ready_states)
+    return time.perf_counter() - start
+
+def bench(profile, urls, rounds, settle):
+    ready_states = ('interactive', 'complete') if profile == 'lean' else ('complete',)
+    driver = web_driver.get_driver(profile)
+    try:
+        # Warm up so the launch and first connection aren't counted
+        load(driver, urls[0], ready_states)
+
+        seconds, transferred, requests = 0.0, 0, 0
+        for _ in range(rounds):
+            for url in urls:
+                seconds += load(driver, url, ready_states)
+                # Let requests started after the DOM was ready finish before counting bytes
+                time.sleep(settle)
+                usage = driver.execute_script(TRANSFER_SCRIPT)
+                transferred += usage['bytes']
+                requests += usage['requests']
+    finally:
+        driver.quit()
+        web_driver.release_driver_profile(driver)
+
+    loads = rounds * len(urls)
+    print(f"{profile:<6} {seconds / loads:8.2f} s/page  {transferred / loads / 1024:10.0f} KB/page  {requests / loads:6.0f} requests/page")
+    return seconds / loads, transferred / loads
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs lean browser profile comparison")
+    parser.add_argument('urls', nargs='*', help="pages to load (default: first results page from BASE_URL)")
+    parser.add_argument('--rounds', type=int, default=3, help="times each page is loaded per profile")
+    parser.add_argument('--settle', type=float, default=2, help="seconds to wait after load before counting bytes")
+    args = parser.parse_args()
+
+    urls = args.urls or [os.getenv('BASE_URL', '') + '1']
+    print(f"{len(urls)} pages, {args.rounds} rounds, browser: {'chrome' if web_driver.USE_CHROME else 'firefox'}")
+    full_time, full_bytes = bench('full', urls, args.rounds, args.settle)
+    lean_time, lean_bytes = bench('lean', urls, args.rounds, args.settle)
+    if lean_time and lean_bytes:
+        print(f"Lean profile: {full_time / lean_time:.1f}x faster, {full_bytes / lean_bytes:.1f}x fewer bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+# Compares per-row commits on a default connection with the batched writer on a tuned
+# connection. Usage: python benchmarks/bench_db_writes.py [rows]
+
+def create_db(path, tuned):
+    db.DB_NAME = path
+    conn, c = db.setup_db()
+    if not tuned:
+        # Undo the pragmas to measure the old behaviour
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.execute('PRAGMA synchronous=FULL')
+    return conn, c
+
+def bench_per_row(path, rows):
+    conn, c = create_db(path, tuned=False)
+    start = time.perf_counter()
+    for i in range(rows):
+        db.insert_ad(c, f'Car {i}', f'https://www.olx.ro/d/oferta/car-{i}', 3000 + i, 'Fix', 'Cluj', '01-01-2025 00:00', 'N/A', 2010, 150000, 'car')
+        db.save_rating(conn, c, f'ad-{i}', 5.0, 'low', 'high')
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+def bench_batched(path, rows):
+    conn, c = create_db(path, tuned=True)
+    start = time.perf_counter()
+    with db.BatchWriter(conn) as writer:
+        for i in range(rows):
+            writer.insert_ad(f'Car {i}', f'https://www.olx.ro/d/oferta/car-{i}', 3000 + i, 'Fix', 'Cluj', '01-01-2025 00:00', 'N/A', 2010, 150000, 'car')
+            writer.save_rating(f'ad-{i}', 5.0, 'low', 'high')
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = bench_per_row(os.path.join(tmp, 'per_row.db'), rows)
+        after = bench_batched(os.path.join(tmp, 'batched.db'), rows)
+
+    writes = rows * 2
+    print(f"Rows written: {writes} ({rows} ads + {rows} ratings)")
+    print(f"Per-row commits, default journal: {writes / before:10.0f} writes/sec")
+    print(f"Batched writer, WAL + NORMAL:     {writes / after:10.0f} writes/sec")
+    print(f"Speedup: {before / after:.1f}x")
+
+if __name__ == "__main__":
+    main()
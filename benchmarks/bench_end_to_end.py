@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks.fake_server import FakeServer
+
+# Times results scraping, detail scraping and each way of rating as separate stages, then a
+# whole run through the real pipeline (python app.py), against saved pages and a stub LLM
+# server, without touching OLX/Autovit or LM Studio.
+# Usage: python benchmarks/bench_end_to_end.py [--pages 4] [--llm-latency 0.2] [--json out.json]
+
+PLACEHOLDER_DETAILS = {
+    'description': 'Masina este in stare foarte buna, intretinuta la zi.',
+    'parameters': {'seller_type': 'Persoana fizica', 'Combustibil': 'Diesel'},
+}
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+@contextlib.contextmanager
+def quiet(enabled):
+    if enabled:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    else:
+        yield
+
+def count_ratings(db):
+    conn, c = db.setup_db()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM ai_ratings').fetchone()[0]
+    finally:
+        db.close_db(conn)
+
+def reset_database(app, db):
+    # The pipeline run starts from an empty database, like a first run of the app
+    if app.conn is not None:
+        db.close_db(app.conn)
+        app.conn = app.c = None
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(db.DB_NAME + suffix)
+
+def timed(results, name, count, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    results[f'{name}_seconds'] = round(elapsed, 3)
+    results[f'{name}_per_sec'] = round(count() / elapsed, 2) if elapsed else 0.0
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end throughput benchmark")
+    parser.add_argument('--pages', type=int, default=4, help="results pages to scrape")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="seconds the stub LLM takes per request")
+    parser.add_argument('--concurrency', type=int, default=4, help="in-flight requests for the async rating run")
+    parser.add_argument('--batch-size', default='auto', help="listings per request for the batch rating run (number or 'auto')")
+    parser.add_argument('--skip-details', action='store_true', help="skip detail scraping and rate with placeholder details")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--verbose', action='store_true', help="show the scraper's own output")
+    args = parser.parse_args()
+
+    server = FakeServer(llm_latency=args.llm_latency).start()
+    workdir = tempfile.TemporaryDirectory(prefix='adsai-bench-')
+
+    # Configure the app before it's imported, it reads settings at import time
+    os.environ.update({
+        'BASE_URL': f'{server.base}/olx.ro/results?page=',
+        'MAX_PAGES': str(args.pages),
+        'RATE_LIMIT_PER_SEC': '0',
+        'FETCH_MODE': 'http',
+        'INCREMENTAL': 'false',
+        'DB_NAME': os.path.join(workdir.name, 'bench.db'),
+        'MIN_PRICE': '0',
+        'MAX_PRICE': '10000000',
+        'PREFERENCES': 'benchmark',
+        'LM_STUDIO_URL': f'{server.base}/v1',
+        'LM_STUDIO_API_KEY': 'bench',
+        'LM_STUDIO_MODEL': 'stub',
+        'LLM_CACHE_ENABLED': 'false',
+        'LLM_CONCURRENCY': str(args.concurrency),
+        'RATING_BATCH_SIZE': args.batch_size,
+    })
+    import db
+    import ai
+    import app
+    from web_drivers import web_driver
+
+    results = {'pages': args.pages, 'llm_latency': args.llm_latency}
+    try:
+        # Stage 1: results pages
+        with quiet(not args.verbose):
+            timed(results, 'pages', lambda: args.pages, app.scrape_listings)
+        listings = list(db.iter_unrated_listings())
+        results['ads'] = len(listings)
+        results['ads_per_sec'] = round(len(listings) / results['pages_seconds'], 2)
+
+        # Stage 2: detail pages, one per listing (embedded page state over HTTP, browser as fallback)
+        details = []
+        if args.skip_details:
+            details = [PLACEHOLDER_DETAILS] * len(listings)
+        else:
+            def scrape_details():
+                for listing in listings:
+                    details.append(ai.scrape_detailed_data(listing['url']) or PLACEHOLDER_DETAILS)
+            with quiet(not args.verbose):
+                timed(results, 'details', lambda: len(details), scrape_details)
+            web_driver.close_pool()
+
+        # Stage 3: sequential ratings through the sync client
+        llm = ai.get_llm()
+        ratings = []
+        def rate_sync():
+            for listing, listing_details in zip(listings, details):
+                ratings.append(ai.calculate_rating(listing, listing_details, ai.Preferences('benchmark'), llm))
+        with quiet(not args.verbose):
+            timed(results, 'ratings', lambda: len(ratings), rate_sync)
+
+        # Stage 4: concurrent ratings through the async client
+        async_ratings = []
+        async def consume():
+            async for item in ai.rate_many(listings, details, ai.Preferences('benchmark'), max_concurrency=args.concurrency):
+                async_ratings.append(item)
+        with quiet(not args.verbose):
+            timed(results, 'ratings_async', lambda: len(async_ratings), lambda: asyncio.run(consume()))
+
+        # Stage 5: several listings per request
+        batch_size = ai.rating_batch_size(ai.Preferences('benchmark'))
+        batch_ratings = []
+        def rate_batches():
+            items = list(zip(listings, details))
+            for start in range(0, len(items), batch_size):
+                batch_ratings.extend(ai.calculate_ratings(items[start:start + batch_size], ai.Preferences('benchmark'), llm))
+        with quiet(not args.verbose):
+            timed(results, 'ratings_batch', lambda: len(batch_ratings), rate_batches)
+        results['batch_size'] = batch_size
+
+        # Stage 6: a whole run as python app.py does it, results pages feeding the pipeline's
+        # detail, rating and writer stages while they're still being scraped
+        reset_database(app, db)
+        if args.skip_details:
+            ai.scrape_detailed_data = lambda url: PLACEHOLDER_DETAILS
+        with quiet(not args.verbose):
+            timed(results, 'pipeline', lambda: count_ratings(db), app.run)
+        results['pipeline_rated'] = count_ratings(db)
+
+        results['llm_requests'] = server.llm_requests
+        results['llm_peak_in_flight'] = server.llm_peak_in_flight
+        results['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    finally:
+        web_driver.close_pool()
+        server.stop()
+        workdir.cleanup()
+
+    print(f"Results pages:  {results['pages_per_sec']:8.2f} pages/sec, {results['ads_per_sec']:8.2f} ads/sec ({results['ads']} ads)")
+    if 'details_per_sec' in results:
+        print(f"Detail pages:   {results['details_per_sec']:8.2f} ads/sec")
+    print(f"Ratings (sync): {results['ratings_per_sec']:8.2f} ratings/sec")
+    print(f"Ratings (async, {args.concurrency} in flight): {results['ratings_async_per_sec']:8.2f} ratings/sec")
+    print(f"Ratings (batches of {results['batch_size']}): {results['ratings_batch_per_sec']:8.2f} ratings/sec")
+    print(f"Pipeline run:   {results['pipeline_per_sec']:8.2f} ratings/sec ({results['pipeline_rated']} rated in "
+          f"{results['pipeline_seconds']:.1f} s, scraping included)")
+    print(f"Peak RSS:       {results['peak_rss_mb']:8.1f} MB (this process, browsers not included)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import glob
+import os
+import sys
+import time
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import listing_parser
+
+# Measures cards/sec for the card parser over saved results pages.
+# Usage: python benchmarks/bench_parse_cards.py [page.html ...]
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+def parse_full_tree(html):
+    # The previous approach: build the whole page with html.parser, then search for cards
+    soup = BeautifulSoup(html, 'html.parser')
+    for _, attrs in listing_parser.CARD_SELECTORS:
+        ads = soup.find_all('div', attrs)
+        if ads:
+            return [card for card in map(listing_parser.parse_card, ads) if card]
+    return []
+
+def bench(name, parse, pages, rounds):
+    cards = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            cards += len(parse(html))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {cards / elapsed:10.0f} cards/sec  ({elapsed / (rounds * len(pages)) * 1000:.1f} ms/page)")
+    return elapsed
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(PAGES_DIR, '*_results_*.html')))
+    pages = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+
+    rounds = 5
+    print(f"{len(pages)} pages, {rounds} rounds")
+    baseline = bench("full tree, html.parser", parse_full_tree, pages, rounds)
+    bench("card subtrees, html.parser", lambda html: listing_parser.parse_listing_cards(html, 'html.parser', use_state=False), pages, rounds)
+    if listing_parser.HTML_PARSER != 'html.parser':
+        fast = bench(f"{listing_parser.HTML_PARSER} tree + XPath", lambda html: listing_parser.parse_listing_cards(html, use_state=False), pages, rounds)
+        print(f"Speedup: {baseline / fast:.1f}x")
+    state = bench("embedded page state", lambda html: listing_parser.parse_listing_cards(html, use_state=True), pages, rounds)
+    print(f"Speedup: {baseline / state:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks.fake_server import FakeServer
+
+# Pre-filter cost on synthetic listings: per-listing Python cosine loop vs one NumPy batch,
+# TF-IDF ranking, and embedding ranking against the stub server, cold and with the vectors
+# already stored in SQLite.
+# Usage: python benchmarks/bench_prefilter.py [--listings 2000] [--top-n 100] [--llm-latency 0.05]
+
+WORDS = ('diesel benzina automata manuala break sedan suv hatchback clima navigatie piele xenon '
+         'senzori parcare camera carte service revizie distributie schimbata ulei anvelope iarna '
+         'vara rugina zgarieturi accident proprietar unic importata inmatriculata romania garantie '
+         'consum mic motor cutie ambreiaj volanta turbo injectoare faruri jante aliaj tractiune').split()
+
+PREFERENCES = 'Break diesel cu cutie automata, consum mic, carte service, fara rugina, proprietar unic'
+
+def make_items(count, seed=1):
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        listing = {'id': f'ad-{i}', 'title': ' '.join(rng.choices(WORDS, k=5)), 'url': f'https://www.olx.ro/d/oferta/car-{i}'}
+        details = {'description': ' '.join(rng.choices(WORDS, k=rng.randint(40, 200))), 'parameters': {}}
+        items.append((listing, details))
+    return items
+
+def python_cosines(matrix, query):
+    # One listing at a time, the way a loop over rows would do it
+    query = query.tolist()
+    query_norm = sum(value * value for value in query) ** 0.5
+    scores = []
+    for row in matrix.tolist():
+        dot = sum(a * b for a, b in zip(row, query))
+        norm = sum(value * value for value in row) ** 0.5 * query_norm
+        scores.append(dot / norm if norm else 0.0)
+    return scores
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Listing pre-filter benchmark")
+    parser.add_argument('--listings', type=int, default=2000, help="synthetic listings to rank")
+    parser.add_argument('--top-n', type=int, default=100, help="listings kept for rating")
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="seconds the stub server takes per embeddings request")
+    args = parser.parse_args()
+
+    server = FakeServer(llm_latency=args.llm_latency).start()
+    workdir = tempfile.mkdtemp(prefix='adsai-bench-')
+    os.environ.update({
+        'DB_NAME': os.path.join(workdir, 'bench.db'),
+        'LM_STUDIO_URL': f'{server.base}/v1',
+        'LM_STUDIO_API_KEY': 'bench',
+    })
+    import ai
+    import prefilter
+
+    items = make_items(args.listings)
+    preferences = ai.Preferences(PREFERENCES)
+    try:
+        # Similarity math alone, on 384-dimension vectors like a small embedding model returns
+        matrix = np.random.default_rng(1).random((args.listings, 384), dtype=np.float32)
+        query = matrix[0]
+        loop_seconds, _ = timed(lambda: python_cosines(matrix, query))
+        numpy_seconds, _ = timed(lambda: prefilter.cosine_similarities(matrix, query))
+        print(f"Cosine, Python loop: {loop_seconds * 1000:9.1f} ms")
+        print(f"Cosine, NumPy batch: {numpy_seconds * 1000:9.1f} ms ({loop_seconds / numpy_seconds:.0f}x faster)")
+
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        tfidf = prefilter.Prefilter(preferences, ai.get_llm, top_n=args.top_n, model='')
+        with quiet:
+            tfidf_seconds, kept = timed(lambda: tfidf.select(items))
+        print(f"TF-IDF ranking:      {tfidf_seconds * 1000:9.1f} ms for {args.listings} listings")
+
+        embeddings = prefilter.Prefilter(preferences, ai.get_llm, top_n=args.top_n, model='stub')
+        with contextlib.redirect_stdout(io.StringIO()):
+            cold_seconds, _ = timed(lambda: embeddings.select(items))
+            requests = server.embedding_requests
+            warm_seconds, _ = timed(lambda: embeddings.select(items))
+        print(f"Embeddings, cold:    {cold_seconds * 1000:9.1f} ms ({requests} requests)")
+        print(f"Embeddings, stored:  {warm_seconds * 1000:9.1f} ms ({server.embedding_requests - requests} request for the preferences)")
+        print(f"LLM rating calls:    {len(kept)} instead of {args.listings}")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
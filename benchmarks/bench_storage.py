@@ -0,0 +1,135 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+# Database size and query speed of the UUID layout, the same database converted in place
+# to the compact layout (DB_COMPACT=true), and a compact database filled by the writer.
+# Usage: python benchmarks/bench_storage.py [--listings 50000] [--lookups 5000]
+
+WORDS = ('masina foarte buna consum mic motor diesel cutie automata carte service revizie facuta '
+         'rugina pe praguri pret corect pentru anul fabricatiei kilometraj real proprietar unic '
+         'accidentata vopsita recent anvelope noi distributie schimbata dotari bogate navigatie').split()
+
+# The README's listings-with-ratings query
+JOIN_SQL = '''
+    SELECT a.id, a.title, a.url, a.price, r.rating, r.reasoning_low, r.reasoning_high
+    FROM advertisements a
+    LEFT JOIN ai_ratings r ON a.id = r.ad_id
+    ORDER BY r.rating DESC
+'''
+
+def sentence(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize() + '.'
+
+def fill(path, listings, compact, seed=1):
+    db.DB_NAME = path
+    db.DB_COMPACT = compact
+    rng = random.Random(seed)
+    conn, c = db.setup_db()
+    with db.BatchWriter(conn, batch_size=1000) as writer:
+        for i in range(listings):
+            listing = writer.insert_ad(f'Volkswagen Golf {i}', f'https://www.olx.ro/d/oferta/golf-{i}-IDx{i:07d}.html',
+                                       2500 + i % 1500, 'Negociabil', 'Cluj-Napoca', '01-01-2025 12:00', 'N/A',
+                                       2005 + i % 15, 100000 + i % 200000, 'car', fuel='Diesel', gearbox='Manuala')
+            writer.record_job('listing', listing['id'], 'scraped', 1)
+            # Most listings get their details scraped and rated
+            if i % 5:
+                writer.save_listing_details(listing['id'], {'description': sentence(rng, 120), 'parameters': {'Combustibil': 'Diesel'}})
+                writer.save_rating(listing['id'], rng.randint(1, 10), sentence(rng, 40), sentence(rng, 40))
+                writer.record_job('listing', listing['id'], 'rated', 1)
+    db.close_db(conn)
+
+def size_mb(path):
+    return os.path.getsize(path) / 1e6
+
+def index_mb(conn):
+    # Space used by indexes, None when SQLite was built without the dbstat table
+    try:
+        used = conn.execute('''
+            SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE type = 'index')
+        ''').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    return (used or 0) / 1e6
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def measure(path, lookups):
+    db.DB_NAME = path
+    conn, c = db.setup_db()
+    rng = random.Random(2)
+    listings = conn.execute('SELECT COUNT(*) FROM advertisements').fetchone()[0]
+    urls = [f'https://www.olx.ro/d/oferta/golf-{i}-IDx{i:07d}.html' for i in rng.sample(range(listings), min(lookups, listings))]
+    ids = [row[0] for row in conn.execute('SELECT ad_id FROM ai_ratings ORDER BY random() LIMIT ?', (lookups,))]
+
+    def lookup_ratings():
+        for ad_id in ids:
+            db.get_rating(c, ad_id)
+
+    results = {
+        'size': size_mb(path),
+        'indexes': index_mb(conn),
+        'join': timed(lambda: conn.execute(JOIN_SQL).fetchall()),
+        'unrated': timed(lambda: sum(1 for _ in db.iter_unrated_listings(db_path=path))),
+        'url lookups': timed(lambda: [db.is_duplicate_ad(c, url) for url in urls]),
+        'rating lookups': timed(lookup_ratings),
+    }
+    db.close_db(conn)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Database layout benchmark")
+    parser.add_argument('--listings', type=int, default=50000, help="synthetic listings, 4 in 5 with details and a rating")
+    parser.add_argument('--lookups', type=int, default=5000, help="URL and rating lookups timed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, 'legacy.db')
+        converted = os.path.join(tmp, 'converted.db')
+        compact = os.path.join(tmp, 'compact.db')
+        quiet = contextlib.redirect_stdout(io.StringIO())
+
+        with quiet:
+            fill(legacy, args.listings, compact=False)
+            fill(compact, args.listings, compact=True)
+        shutil.copy(legacy, converted)
+
+        db.DB_NAME = converted
+        db.DB_COMPACT = True
+        start = time.perf_counter()
+        with quiet:
+            conn, c = db.setup_db()
+        migration = time.perf_counter() - start
+        db.close_db(conn)
+        db.DB_COMPACT = False
+
+        layouts = [('UUID layout', measure(legacy, args.lookups)),
+                   ('Converted', measure(converted, args.lookups)),
+                   ('Compact, filled', measure(compact, args.lookups))]
+
+    print(f"{args.listings} listings, {args.lookups} lookups, conversion took {migration:.1f} s")
+    print(f"{'':16} {'size MB':>9} {'index MB':>9} {'join ms':>9} {'unrated ms':>11} {'URL lookup ms':>14} {'rating lookup ms':>17}")
+    for name, r in layouts:
+        indexes = f"{r['indexes']:9.1f}" if r['indexes'] is not None else f"{'n/a':>9}"
+        print(f"{name:16} {r['size']:9.1f} {indexes} {r['join'] * 1000:9.1f} {r['unrated'] * 1000:11.1f} "
+              f"{r['url lookups'] * 1000:14.1f} {r['rating lookups'] * 1000:17.1f}")
+
+if __name__ == "__main__":
+    main()
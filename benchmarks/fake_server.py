@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for OLX/Autovit/Storia and an OpenAI-compatible LLM server.
+#
+#   /olx.ro/results?page=N    saved OLX results pages (cycled)
+#   /olx.ro/...               saved OLX detail page
+#   /autovit.ro/...           saved Autovit detail page
+#   /storia.ro/...            saved Storia detail page
+#   /v1/chat/completions      stub returning a rate_car (or batch rate_cars) tool call after llm_latency seconds
+#   /v1/embeddings            stub returning hashed bag-of-words vectors after llm_latency seconds
+#
+# Listing links in the results pages (markup and embedded page state) are rewritten to point back at this server, with the
+# site name kept in the path so scrape_detailed_data still picks the right branch.
+
+EMBEDDING_DIMENSIONS = 384
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+class FakeServer:
+    def __init__(self, llm_latency=0.5, port=0):
+        self.llm_latency = llm_latency
+        self.requests = 0
+        self.llm_requests = 0
+        self.embedding_requests = 0
+        self.llm_in_flight = 0
+        self.llm_peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._pages = {}
+
+        for name in os.listdir(PAGES_DIR):
+            if name.endswith('.html'):
+                with open(os.path.join(PAGES_DIR, name), encoding='utf-8') as f:
+                    self._pages[name[:-5]] = f.read()
+        self.results_pages = sorted(name for name in self._pages if name.startswith('olx_results_'))
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.base = f'http://127.0.0.1:{self.port}'
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def results_page(self, page):
+        html = self._pages[self.results_pages[(page - 1) % len(self.results_pages)]]
+        # Make every page's ads unique, then point the links back at this server
+        if page > len(self.results_pages):
+            html = html.replace('-ID', f'-P{page}-ID')
+        return (html
+                .replace('href="/d/oferta/', f'href="{self.base}/olx.ro/d/oferta/')
+                .replace('https://www.olx.ro/d/oferta/', f'{self.base}/olx.ro/d/oferta/')
+                .replace('https://www.autovit.ro/', f'{self.base}/autovit.ro/')
+                .replace('https://www.storia.ro/', f'{self.base}/storia.ro/'))
+
+    def completion(self, body):
+        with self._lock:
+            self.llm_requests += 1
+            self.llm_in_flight += 1
+            self.llm_peak_in_flight = max(self.llm_peak_in_flight, self.llm_in_flight)
+        try:
+            time.sleep(self.llm_latency)
+        finally:
+            with self._lock:
+                self.llm_in_flight -= 1
+
+        prompt_chars = sum(len(m.get('content') or '') for m in body.get('messages', []))
+        tool_name = body['tools'][0]['function']['name'] if body.get('tools') else 'rate_car'
+        if tool_name == 'rate_cars':
+            # Batch request: one entry per ad_id in the prompt
+            ad_ids = re.findall(r'=== ad_id: (\d+) ===', body['messages'][-1].get('content') or '')
+            arguments = json.dumps({'ratings': [
+                {'ad_id': int(ad_id), 'rating': 7, 'reasoning': 'Stub rating from the benchmark server.'} for ad_id in ad_ids
+            ]})
+        else:
+            arguments = json.dumps({'rating': 7, 'reasoning': 'Stub rating from the benchmark server.'})
+        return {
+            'id': f'chatcmpl-bench-{self.llm_requests}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model') or 'stub',
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'tool_calls',
+                'message': {
+                    'role': 'assistant',
+                    'content': None,
+                    'tool_calls': [{
+                        'id': f'call_{self.llm_requests}',
+                        'type': 'function',
+                        'function': {'name': tool_name, 'arguments': arguments},
+                    }],
+                },
+            }],
+            'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': 20, 'total_tokens': prompt_chars // 4 + 20},
+        }
+
+    def embeddings(self, body):
+        with self._lock:
+            self.embedding_requests += 1
+        time.sleep(self.llm_latency)
+
+        texts = body.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts]
+        data = []
+        for index, text in enumerate(texts):
+            vector = [0.0] * EMBEDDING_DIMENSIONS
+            for word in re.findall(r'\w+', text.lower()):
+                vector[zlib.crc32(word.encode('utf-8')) % EMBEDDING_DIMENSIONS] += 1.0
+            data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+        tokens = sum(len(text) for text in texts) // 4
+        return {
+            'object': 'list',
+            'data': data,
+            'model': body.get('model') or 'stub',
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                url = urlparse(self.path)
+                if url.path.startswith('/olx.ro/results'):
+                    page = int(parse_qs(url.query).get('page', ['1'])[0] or 1)
+                    return self._send(200, server.results_page(page))
+                for site in ('olx', 'autovit', 'storia'):
+                    if url.path.startswith(f'/{site}.ro/'):
+                        return self._send(200, server._pages[f'{site}_detail'])
+                self._send(404, '<html><body>Not found</body></html>')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if self.path.rstrip('/').endswith('/chat/completions'):
+                    return self._send(200, json.dumps(server.completion(body)), 'application/json')
+                if self.path.rstrip('/').endswith('/embeddings'):
+                    return self._send(200, json.dumps(server.embeddings(body)), 'application/json')
+                self._send(404, json.dumps({'error': 'not found'}), 'application/json')
+
+            def _send(self, status, text, content_type='text/html; charset=utf-8'):
+                data = text.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,19 +1,174 @@
+import contextlib
+import hashlib
 import sqlite3
 import uuid
 import os
+import json
+import time
+import zlib
+import metrics
+import attributes
 
 # Get database name from environment variables
 DB_NAME = os.getenv('DB_NAME', 'data.db')
 
+# WAL needs every process on one machine, workers on other hosts sharing the file over
+# a network filesystem need a rollback journal such as DELETE
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+
+# Compact layout: listings keyed by an integer hash of their URL instead of a UUID string,
+# ratings keyed by that id and their long reasoning zlib-compressed. Databases in the UUID
+# layout are converted in place on the next start, see migrate_compact.
+DB_COMPACT = os.getenv('DB_COMPACT', 'false').lower() == 'true'
+# Shorter reasoning is stored as plain text even in the compact layout
+COMPRESS_MIN_BYTES = 512
+
+# Batched writer settings (rows per transaction, max seconds a row stays buffered)
+DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', '100'))
+DB_FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '2'))
+
+# Listings whose detail scrape or rating failed this many times are no longer retried
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+AD_COLUMNS = ('id', 'title', 'url', 'price', 'negotiable', 'location', 'date', 'size', 'age', 'kilometers', 'listing_type',
+              'fuel', 'gearbox', 'horsepower', 'body_type', 'seller_type')
+
+# Typed listing attributes added after the first schema, with their column types.
+# Most are only known once the detail page is read.
+ATTRIBUTE_COLUMNS = (('fuel', 'TEXT'), ('gearbox', 'TEXT'), ('horsepower', 'INT'), ('body_type', 'TEXT'), ('seller_type', 'TEXT'))
+
+# Columns the listing filters use
+INDEXED_COLUMNS = ('age', 'kilometers', 'horsepower', 'fuel', 'gearbox')
+
+INSERT_AD_SQL = '''
+    INSERT OR IGNORE INTO advertisements (id, title, url, price, negotiable, location, date, size, age, kilometers, listing_type,
+                                          fuel, gearbox, horsepower, body_type, seller_type)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Attributes read from a detail page fill in what the card didn't have
+UPDATE_ATTRIBUTES_SQL = '''
+    UPDATE advertisements SET
+        age = COALESCE(age, ?),
+        kilometers = COALESCE(kilometers, ?),
+        fuel = COALESCE(fuel, ?),
+        gearbox = COALESCE(gearbox, ?),
+        horsepower = COALESCE(horsepower, ?),
+        body_type = COALESCE(body_type, ?),
+        seller_type = COALESCE(seller_type, ?)
+    WHERE id = ?
+'''
+
+SAVE_RATING_SQL = '''
+    INSERT OR REPLACE INTO ai_ratings (id, ad_id, rating, reasoning_low, reasoning_high)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# The compact ai_ratings table is keyed by the listing id
+SAVE_COMPACT_RATING_SQL = '''
+    INSERT OR REPLACE INTO ai_ratings (ad_id, rating, reasoning_low, reasoning_high)
+    VALUES (?, ?, ?, ?)
+'''
+
+# One statement for successes and failures, so a listing's events apply in the order they were buffered.
+# attempts is 1 for a failure and 0 otherwise, and adds up across runs.
+RECORD_JOB_SQL = '''
+    INSERT INTO jobs (kind, key, run_id, stage, status, attempts, last_error, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (kind, key) DO UPDATE SET
+        run_id = excluded.run_id,
+        stage = excluded.stage,
+        status = excluded.status,
+        attempts = jobs.attempts + excluded.attempts,
+        last_error = excluded.last_error,
+        updated_at = excluded.updated_at,
+        lease_owner = CASE WHEN excluded.status = 'failed' OR excluded.stage = 'rated' THEN NULL ELSE jobs.lease_owner END,
+        lease_expires = CASE WHEN excluded.status = 'failed' OR excluded.stage = 'rated' THEN NULL ELSE jobs.lease_expires END
+'''
+
+# Work queue leases, see claim_listings. A finished or failed listing releases its lease.
+LEASE_COLUMNS = (('lease_owner', 'TEXT'), ('lease_expires', 'REAL'))
+
+SAVE_DETAILS_SQL = '''
+    INSERT OR REPLACE INTO listing_details (ad_id, details, fetched_at)
+    VALUES (?, ?, CURRENT_TIMESTAMP)
+'''
+
+def apply_pragmas(conn):
+    # WAL (the default) lets readers run alongside the writer, and NORMAL sync only fsyncs at checkpoints
+    conn.execute(f'PRAGMA journal_mode={DB_JOURNAL_MODE}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-65536')  # 64 MB
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA busy_timeout=10000')
+
+class Connection(sqlite3.Connection):
+    # Connections opened by setup_db remember the database layout, see is_compact
+    compact = None
+
 def setup_db():
     # Connect to SQLite database (or create one if it doesn't exist)
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, factory=Connection)
+    apply_pragmas(conn)
     c = conn.cursor()
 
-    # Create a table for advertisements (if not exists)
+    # A new database gets the compact layout with DB_COMPACT, an existing one keeps its own
+    # until migrate_compact converts it
+    create_listing_tables(c, compact=DB_COMPACT or _has_integer_ids(conn))
+
+    # Create tables tracking runs and the progress of each results page and listing, so an
+    # interrupted run can be resumed and failing listings aren't retried forever.
+    # jobs.key is the page URL for kind 'page' and the ad id for kind 'listing'.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            resumes INT DEFAULT 0
+        )
+    ''')
     c.execute('''
-        CREATE TABLE IF NOT EXISTS advertisements (
-            id TEXT PRIMARY KEY,
+        CREATE TABLE IF NOT EXISTS jobs (
+            kind TEXT,
+            key TEXT,
+            run_id INT,
+            stage TEXT,
+            status TEXT,
+            attempts INT DEFAULT 0,
+            last_error TEXT,
+            updated_at REAL,
+            lease_owner TEXT,
+            lease_expires REAL,
+            PRIMARY KEY (kind, key)
+        )
+    ''')
+    add_missing_columns(conn, 'jobs', LEASE_COLUMNS)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_run ON jobs (run_id, kind, status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (lease_owner)')
+
+    migrate_attributes(conn)
+    migrate_compact(conn)
+
+    # Compact databases look URLs up by their hash, which is the primary key
+    conn.compact = _has_integer_ids(conn)
+    if not conn.compact:
+        create_url_index(c)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_price ON advertisements (price)')
+    for column in INDEXED_COLUMNS:
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_advertisements_{column} ON advertisements ({column})')
+
+    return conn, c
+
+def create_listing_tables(c, compact=False, suffix=''):
+    # Listings and the tables keyed by listing id. The compact layout uses integer ids
+    # (see url_hash) and drops the ratings' own UUID key.
+    id_type = 'INTEGER' if compact else 'TEXT'
+
+    # Create a table for advertisements (if not exists)
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS advertisements{suffix} (
+            id {id_type} PRIMARY KEY,
             title TEXT,
             url TEXT,
             price INT,
@@ -23,66 +178,580 @@ def setup_db():
             size INT,
             age INT,
             kilometers INT,
-            listing_type TEXT
+            listing_type TEXT,
+            fuel TEXT,
+            gearbox TEXT,
+            horsepower INT,
+            body_type TEXT,
+            seller_type TEXT
         )
     ''')
 
-    # Create a table for AI ratings
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS ai_ratings (
-            id TEXT PRIMARY KEY,
-            ad_id TEXT UNIQUE,
-            rating REAL,
-            reasoning_low TEXT,
-            reasoning_high TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    # Create a table for AI ratings, compact databases store the reasoning as zlib blobs (see compress_text)
+    if compact:
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS ai_ratings{suffix} (
+                ad_id INTEGER PRIMARY KEY,
+                rating REAL,
+                reasoning_low BLOB,
+                reasoning_high BLOB,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (ad_id) REFERENCES advertisements(id)
+            )
+        ''')
+    else:
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS ai_ratings{suffix} (
+                id TEXT PRIMARY KEY,
+                ad_id TEXT UNIQUE,
+                rating REAL,
+                reasoning_low TEXT,
+                reasoning_high TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (ad_id) REFERENCES advertisements(id)
+            )
+        ''')
+
+    # Create a table for scraped detail pages, stored as zlib-compressed JSON
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS listing_details{suffix} (
+            ad_id {id_type} PRIMARY KEY,
+            details BLOB,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (ad_id) REFERENCES advertisements(id)
         )
     ''')
 
-    return conn, c
+    # Create a table for listing embeddings used by the pre-filter, stored as float32 blobs.
+    # text_hash detects listings whose title or description changed since they were embedded.
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS listing_embeddings{suffix} (
+            ad_id {id_type},
+            model TEXT,
+            text_hash TEXT,
+            vector BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (ad_id, model)
+        )
+    ''')
+
+def is_compact(conn):
+    # Read once per connection from setup_db, other connections look at the schema every time
+    compact = getattr(conn, 'compact', None)
+    return _has_integer_ids(conn) if compact is None else compact
+
+def _has_integer_ids(conn):
+    row = conn.execute("SELECT type FROM pragma_table_info('advertisements') WHERE name = 'id'").fetchone()
+    return row is not None and row[0].upper() == 'INTEGER'
+
+def url_hash(url):
+    # Listing id in the compact layout: 63 bits of the URL's BLAKE2 hash. Every process derives
+    # the same id without asking the database, and a listing is found from its URL through the
+    # primary key. Two URLs sharing a hash (about one chance in 10^7 with a million listings)
+    # would be stored as one listing.
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big') >> 1
 
-def insert_ad(c, title, url, price, negotiable, location, date, size, age=None, kilometers=None, listing_type="apartment"):
+def compress_text(text):
+    # zlib blob when that's smaller. Text under COMPRESS_MIN_BYTES stays plain: most reasoning
+    # is that short, saves little and would cost every get_rating two decompressions.
+    if not text:
+        return text
+    data = text.encode('utf-8')
+    if len(data) < COMPRESS_MIN_BYTES:
+        return text
+    packed = zlib.compress(data, 9)
+    return packed if len(packed) < len(data) else text
+
+def decompress_text(value):
+    return zlib.decompress(value).decode('utf-8') if isinstance(value, bytes) else value
+
+def add_missing_columns(conn, table, columns):
+    # For tables that gained columns after databases were created with them
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for name, kind in columns:
+        if name in existing:
+            continue
+        try:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {kind}')
+        except sqlite3.OperationalError as e:
+            # Another connection added it first
+            if 'duplicate column' not in str(e):
+                raise
+
+def migrate_attributes(conn):
+    # Databases created before the typed attribute columns get them added, and their
+    # prices, dates and stored detail pages normalized once
+    def missing_columns():
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(advertisements)')}
+        return [(name, kind) for name, kind in ATTRIBUTE_COLUMNS if name not in columns]
+
+    if not missing_columns():
+        return
+
+    # Other threads opening the database wait here instead of adding the columns twice
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        ad_id = str(uuid.uuid4())
+        missing = missing_columns()
+        if missing:
+            print("Adding typed listing attributes to the database...")
+            for name, kind in missing:
+                conn.execute(f'ALTER TABLE advertisements ADD COLUMN {name} {kind}')
+
+            rows = conn.execute('SELECT id, price, date FROM advertisements').fetchall()
+            conn.executemany('UPDATE advertisements SET price = ?, date = ? WHERE id = ?', [
+                (attributes.parse_price(price), attributes.parse_date(date) or date, ad_id)
+                for ad_id, price, date in rows
+            ])
+            details = conn.execute('SELECT ad_id, details FROM listing_details').fetchall()
+            conn.executemany(UPDATE_ATTRIBUTES_SQL, [
+                _attributes_row(ad_id, json.loads(zlib.decompress(blob).decode('utf-8')))
+                for ad_id, blob in details
+            ])
+            print(f"Normalized {len(rows)} listings and {len(details)} stored detail pages")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def migrate_compact(conn):
+    # With DB_COMPACT, a database in the UUID layout is converted once: listings are copied under
+    # their URL hash, the ratings, details, embeddings and jobs pointing at them follow, and the
+    # reasoning is compressed. Listings sharing a URL become one, keeping the first scraped.
+    if not DB_COMPACT or _has_integer_ids(conn):
+        return
+
+    conn.create_function('url_hash', 1, url_hash, deterministic=True)
+    conn.create_function('compress_text', 1, compress_text, deterministic=True)
+
+    # Other threads opening the database wait here instead of converting it twice
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if _has_integer_ids(conn):
+            conn.rollback()
+            return
+
+        print("Converting the database to the compact layout...")
+        c = conn.cursor()
+        c.execute('CREATE TEMP TABLE compact_ids (old_id TEXT PRIMARY KEY, new_id INT) WITHOUT ROWID')
+        c.execute('INSERT INTO compact_ids SELECT id, url_hash(url) FROM advertisements WHERE url IS NOT NULL')
+
+        create_listing_tables(c, compact=True, suffix='_compact')
+        columns = ', '.join(AD_COLUMNS[1:])
+        c.execute(f'''
+            INSERT OR IGNORE INTO advertisements_compact (id, {columns})
+            SELECT url_hash(url), {columns} FROM advertisements WHERE url IS NOT NULL ORDER BY rowid
+        ''')
+        listings = c.execute('SELECT COUNT(*) FROM advertisements_compact').fetchone()[0]
+        # The latest rating, details and embedding win when duplicates merge
+        c.execute('''
+            INSERT OR IGNORE INTO ai_ratings_compact (ad_id, rating, reasoning_low, reasoning_high, created_at)
+            SELECT m.new_id, r.rating, compress_text(r.reasoning_low), compress_text(r.reasoning_high), r.created_at
+            FROM ai_ratings r JOIN compact_ids m ON m.old_id = r.ad_id
+            ORDER BY r.created_at DESC
+        ''')
         c.execute('''
-            INSERT INTO advertisements (id, title, url, price, negotiable, location, date, size, age, kilometers, listing_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (ad_id, title, url, price, negotiable, location, date, size, age, kilometers, listing_type))
+            INSERT OR IGNORE INTO listing_details_compact (ad_id, details, fetched_at)
+            SELECT m.new_id, d.details, d.fetched_at
+            FROM listing_details d JOIN compact_ids m ON m.old_id = d.ad_id
+            ORDER BY d.fetched_at DESC
+        ''')
+        c.execute('''
+            INSERT OR IGNORE INTO listing_embeddings_compact (ad_id, model, text_hash, vector, created_at)
+            SELECT m.new_id, e.model, e.text_hash, e.vector, e.created_at
+            FROM listing_embeddings e JOIN compact_ids m ON m.old_id = e.ad_id
+            ORDER BY e.created_at DESC
+        ''')
+        c.execute('''
+            UPDATE OR REPLACE jobs SET key = (SELECT new_id FROM compact_ids WHERE old_id = jobs.key)
+            WHERE kind = 'listing' AND key IN (SELECT old_id FROM compact_ids)
+        ''')
+
+        # The indexes go with the old tables, setup_db creates them again
+        for table in ('ai_ratings', 'listing_details', 'listing_embeddings', 'advertisements'):
+            c.execute(f'DROP TABLE {table}')
+            c.execute(f'ALTER TABLE {table}_compact RENAME TO {table}')
+        c.execute('DROP TABLE compact_ids')
+        conn.commit()
+        print(f"Converted {listings} listings")
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Hand the pages the old tables and indexes used back to the filesystem
+    try:
+        conn.execute('VACUUM')
+    except sqlite3.OperationalError as e:
+        print(f"Could not vacuum the database, run VACUUM once nothing else uses it: {str(e)}")
+
+def _ad_row(title, url, price, negotiable, location, date, size, age=None, kilometers=None, listing_type="apartment",
+            fuel=None, gearbox=None, horsepower=None, body_type=None, seller_type=None, compact=False):
+    # Prices are stored as numbers and dates as 'YYYY-MM-DD HH:MM', see attributes.py
+    return (url_hash(url) if compact else str(uuid.uuid4()), title, url, attributes.parse_price(price), negotiable, location,
+            attributes.parse_date(date) or date, size, age, kilometers, listing_type,
+            attributes.normalize_fuel(fuel), attributes.normalize_gearbox(gearbox), attributes.parse_horsepower(horsepower),
+            attributes.normalize_text(body_type), attributes.normalize_seller(seller_type))
+
+def _rating_row(ad_id, rating, reasoning_low, reasoning_high, compact=False):
+    if compact:
+        return (ad_id, rating, compress_text(reasoning_low), compress_text(reasoning_high))
+    return (str(uuid.uuid4()), ad_id, rating, reasoning_low, reasoning_high)
+
+def _rating_sql(compact):
+    return SAVE_COMPACT_RATING_SQL if compact else SAVE_RATING_SQL
+
+def _details_row(ad_id, details):
+    return (ad_id, zlib.compress(json.dumps(details, ensure_ascii=False).encode('utf-8')))
+
+def _attributes_row(ad_id, details):
+    found = attributes.details_attributes(details)
+    return tuple(found.get(column) for column in ('age', 'kilometers', 'fuel', 'gearbox', 'horsepower', 'body_type', 'seller_type')) + (ad_id,)
+
+def _job_row(kind, key, stage, run_id=None, error=None):
+    return (kind, str(key), run_id, stage, 'failed' if error else 'done', 1 if error else 0, error, time.time())
+
+def create_url_index(c):
+    try:
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_advertisements_url ON advertisements (url)')
+    except sqlite3.IntegrityError:
+        # Older databases may already contain duplicate URLs, index them without the constraint
+        print("Duplicate URLs found in advertisements, creating a non-unique URL index")
+        c.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_url ON advertisements (url)')
+
+def insert_ad(c, title, url, price, negotiable, location, date, size, age=None, kilometers=None, listing_type="apartment",
+              fuel=None, gearbox=None, horsepower=None, body_type=None, seller_type=None):
+    try:
+        c.execute(INSERT_AD_SQL, _ad_row(title, url, price, negotiable, location, date, size, age, kilometers, listing_type,
+                                         fuel, gearbox, horsepower, body_type, seller_type, compact=is_compact(c.connection)))
         c.connection.commit()  # Commit after each insert
-        return True
+        # False when the URL was already stored and the insert was ignored
+        return c.rowcount > 0
     except Exception as e:
         print(f"Error inserting ad into database: {str(e)}")
         return False
 
 # Function to check if an ad already exists in the database
 def is_duplicate_ad(c, ad_url):
-    c.execute("SELECT 1 FROM advertisements WHERE url = ?", (ad_url,))
+    if is_compact(c.connection):
+        c.execute("SELECT 1 FROM advertisements WHERE id = ?", (url_hash(ad_url),))
+    else:
+        c.execute("SELECT 1 FROM advertisements WHERE url = ?", (ad_url,))
     return c.fetchone() is not None
 
+def load_known_urls(c):
+    c.execute("SELECT url FROM advertisements")
+    return {row[0] for row in c.fetchall()}
+
 def load_listings_from_db(db_path: str = DB_NAME):
     conn = sqlite3.connect(db_path)
+    apply_pragmas(conn)
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM advertisements')
     listings = cursor.fetchall()
     conn.close()
     return listings
 
+def _unrated_where(listing_filters, max_attempts):
+    # Condition on advertisements a and jobs j shared by the unrated listing queries
+    where, params = listing_filters.where('a') if listing_filters else ('1', [])
+    if max_attempts:
+        where = f"(j.status IS NOT 'failed' OR j.attempts < ?) AND {where}"
+        params = [max_attempts, *params]
+    return where, params
+
+def iter_unrated_listings(listing_filters=None, chunk_size: int = 500, db_path: str = DB_NAME,
+                          max_attempts: int = JOB_MAX_ATTEMPTS):
+    # Streams unrated ads passing the filters (a filters.ListingFilters) as name-addressable
+    # rows, leaving out listings that failed max_attempts times (0 = never).
+    # ai_ratings.ad_id is indexed through its UNIQUE constraint (its primary key when compact),
+    # and jobs.key is text in both layouts, so the id is cast to keep its index usable.
+    # Rows are read a chunk at a time, in id order, and each chunk's read transaction ends
+    # before its rows are handed out: with a rollback journal (DB_JOURNAL_MODE=DELETE) an open
+    # read would keep the pipeline's writer from ever committing.
+    where, params = _unrated_where(listing_filters, max_attempts)
+    conn = sqlite3.connect(db_path)
+    apply_pragmas(conn)
+    conn.row_factory = sqlite3.Row
+    try:
+        last_id = None
+        while True:
+            after = 'AND a.id > ?' if last_id is not None else ''
+            rows = conn.execute(f'''
+                SELECT a.*
+                FROM advertisements a
+                LEFT JOIN ai_ratings r ON r.ad_id = a.id
+                LEFT JOIN jobs j ON j.kind = 'listing' AND j.key = CAST(a.id AS TEXT)
+                WHERE r.ad_id IS NULL AND {where} {after}
+                ORDER BY a.id
+                LIMIT ?
+            ''', [*params, *([last_id] if last_id is not None else []), chunk_size]).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            yield from rows
+    finally:
+        conn.close()
+
+def start_run(conn, resume=False):
+    # Returns (run id, URLs of the results pages that run already finished). With resume,
+    # the latest run that didn't finish is continued, otherwise a new run is started.
+    if resume:
+        row = conn.execute("SELECT id FROM runs WHERE status != 'finished' ORDER BY id DESC LIMIT 1").fetchone()
+        if row:
+            with conn:
+                conn.execute("UPDATE runs SET status = 'running', resumes = resumes + 1 WHERE id = ?", (row[0],))
+            done_pages = {key for (key,) in conn.execute(
+                "SELECT key FROM jobs WHERE kind = 'page' AND run_id = ? AND status = 'done'", (row[0],)
+            )}
+            print(f"Resuming run {row[0]}, {len(done_pages)} results pages already done")
+            return row[0], done_pages
+        print("No unfinished run to resume, starting a new one")
+
+    with conn:
+        run_id = conn.execute("INSERT INTO runs (status) VALUES ('running')").lastrowid
+    return run_id, set()
+
+@contextlib.contextmanager
+def tracked_run(conn, resume=False):
+    # Yields (run id, finished page URLs) from start_run and records how the run ended
+    run_id, done_pages = start_run(conn, resume)
+    status = 'failed'
+    try:
+        yield run_id, done_pages
+        status = 'finished'
+    except KeyboardInterrupt:
+        status = 'interrupted'
+        raise
+    finally:
+        finish_run(conn, run_id, status)
+
+def finish_run(conn, run_id, status='finished'):
+    # status is 'finished', 'interrupted' or 'failed', runs killed outright stay 'running'
+    with conn:
+        conn.execute('UPDATE runs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?', (status, run_id))
+
+def record_job(conn, kind, key, stage, run_id=None, error=None):
+    with conn:
+        conn.execute(RECORD_JOB_SQL, _job_row(kind, key, stage, run_id, error))
+
+def enqueue_unrated_listings(conn):
+    # Gives every unrated listing a job row so workers can claim it, listings scraped
+    # since the jobs table exists already have one. Returns the number added.
+    with conn:
+        return conn.execute('''
+            INSERT OR IGNORE INTO jobs (kind, key, stage, status, attempts, updated_at)
+            SELECT 'listing', a.id, 'scraped', 'done', 0, ?
+            FROM advertisements a
+            LEFT JOIN ai_ratings r ON r.ad_id = a.id
+            WHERE r.ad_id IS NULL
+        ''', (time.time(),)).rowcount
+
+def claim_listings(conn, owner, limit, lease_seconds, listing_filters=None, max_attempts=JOB_MAX_ATTEMPTS):
+    # Leases up to limit unrated listings to owner and returns their ids. The UPDATE runs
+    # in an immediate transaction, so two workers can never claim the same listing, and
+    # listings whose lease expired (their worker died) can be claimed again.
+    # jobs.key is text in both layouts and is cast to the id's type, so the listing is
+    # found through its primary key.
+    id_type = 'INTEGER' if is_compact(conn) else 'TEXT'
+    now = time.time()
+    where, params = _unrated_where(listing_filters, max_attempts)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute(f'''
+            UPDATE jobs SET lease_owner = ?, lease_expires = ?
+            WHERE kind = 'listing' AND key IN (
+                SELECT j.key
+                FROM jobs j
+                JOIN advertisements a ON a.id = CAST(j.key AS {id_type})
+                LEFT JOIN ai_ratings r ON r.ad_id = a.id
+                WHERE j.kind = 'listing' AND r.ad_id IS NULL
+                  AND (j.lease_expires IS NULL OR j.lease_expires < ?)
+                  AND {where}
+                ORDER BY j.updated_at
+                LIMIT ?
+            )
+            RETURNING key
+        ''', [owner, now + lease_seconds, now, *params, limit]).fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [key for (key,) in rows]
+
+def renew_leases(conn, owner, lease_seconds):
+    # Heartbeat, keeps the listings a live worker is still working on leased to it
+    with conn:
+        return conn.execute('UPDATE jobs SET lease_expires = ? WHERE lease_owner = ?',
+                            (time.time() + lease_seconds, owner)).rowcount
+
+def release_leases(conn, owner):
+    with conn:
+        return conn.execute('UPDATE jobs SET lease_owner = NULL, lease_expires = NULL WHERE lease_owner = ?',
+                            (owner,)).rowcount
+
+def load_listings(conn, ad_ids):
+    # Rows keyed by column name, in the order of ad_ids
+    if not ad_ids:
+        return []
+    cursor = conn.execute(f"SELECT * FROM advertisements WHERE id IN ({', '.join('?' * len(ad_ids))})", list(ad_ids))
+    columns = [column[0] for column in cursor.description]
+    # Keyed as text, the way jobs.key holds ids in both layouts
+    rows = {str(listing['id']): listing for listing in (dict(zip(columns, row)) for row in cursor.fetchall())}
+    return [rows[str(ad_id)] for ad_id in ad_ids if str(ad_id) in rows]
+
 def save_rating(conn, cursor, ad_id: str, rating: float, reasoning_low: str, reasoning_high: str):
-    rating_id = str(uuid.uuid4())
-    cursor.execute('''
-        INSERT OR REPLACE INTO ai_ratings (id, ad_id, rating, reasoning_low, reasoning_high)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (rating_id, ad_id, rating, reasoning_low, reasoning_high))
+    compact = is_compact(conn)
+    cursor.execute(_rating_sql(compact), _rating_row(ad_id, rating, reasoning_low, reasoning_high, compact))
     conn.commit()
 
+def save_listing_details(conn, cursor, ad_id: str, details: dict):
+    cursor.execute(SAVE_DETAILS_SQL, _details_row(ad_id, details))
+    cursor.execute(UPDATE_ATTRIBUTES_SQL, _attributes_row(ad_id, details))
+    conn.commit()
+
+def get_listing_details(cursor, ad_id: str, max_age_seconds: float = None):
+    # Returns the stored details dict, or None if missing or older than max_age_seconds
+    query = 'SELECT details FROM listing_details WHERE ad_id = ?'
+    params = [ad_id]
+    if max_age_seconds:
+        query += " AND fetched_at >= datetime('now', ?)"
+        params.append(f'-{int(max_age_seconds)} seconds')
+
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
 def get_rating(cursor, ad_id: str):
     cursor.execute('''
         SELECT rating, reasoning_low, reasoning_high 
         FROM ai_ratings 
         WHERE ad_id = ?
     ''', (ad_id,))
-    return cursor.fetchone()
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    rating, reasoning_low, reasoning_high = row
+    return rating, decompress_text(reasoning_low), decompress_text(reasoning_high)
+
+def get_embeddings(cursor, ad_ids, model: str, chunk_size: int = 500):
+    # Returns {ad_id: (text_hash, vector bytes)} for the ads embedded with this model
+    embeddings = {}
+    ad_ids = list(ad_ids)
+    for start in range(0, len(ad_ids), chunk_size):
+        chunk = ad_ids[start:start + chunk_size]
+        cursor.execute(f'''
+            SELECT ad_id, text_hash, vector FROM listing_embeddings
+            WHERE model = ? AND ad_id IN ({', '.join('?' * len(chunk))})
+        ''', [model, *chunk])
+        for ad_id, text_hash, vector in cursor.fetchall():
+            embeddings[ad_id] = (text_hash, vector)
+    return embeddings
+
+def save_embeddings(conn, model: str, rows):
+    # rows are (ad_id, text_hash, vector bytes) tuples, written in one transaction
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO listing_embeddings (ad_id, model, text_hash, vector)
+            VALUES (?, ?, ?, ?)
+        ''', [(ad_id, model, text_hash, vector) for ad_id, text_hash, vector in rows])
+
+class BatchWriter:
+    # Buffers writes and flushes them with executemany in one transaction every
+    # batch_size rows or flush_interval seconds. Use as a context manager, or
+    # call flush() before relying on the rows being on disk. A flush that fails
+    # is rolled back and its rows stay buffered for the next one.
+    def __init__(self, conn, batch_size=DB_BATCH_SIZE, flush_interval=DB_FLUSH_INTERVAL):
+        self.conn = conn
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.compact = is_compact(conn)
+        self._pending = {}
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._deferred = False
+        # URLs of the ads in the buffer
+        self._buffered_urls = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def insert_ad(self, title, url, price, negotiable, location, date, size, age=None, kilometers=None, listing_type="apartment",
+                  fuel=None, gearbox=None, horsepower=None, body_type=None, seller_type=None):
+        # Returns the row as it will be stored, keyed by column name, so callers don't need to read it back,
+        # or None when the URL is already stored or buffered: the insert would be ignored, and rows
+        # written under the new id would point at no listing
+        if url in self._buffered_urls or is_duplicate_ad(self.conn.cursor(), url):
+            return None
+        row = _ad_row(title, url, price, negotiable, location, date, size, age, kilometers, listing_type,
+                      fuel, gearbox, horsepower, body_type, seller_type, self.compact)
+        self._buffered_urls.add(url)
+        self._add(INSERT_AD_SQL, row)
+        return dict(zip(AD_COLUMNS, row))
+
+    def save_rating(self, ad_id: str, rating: float, reasoning_low: str, reasoning_high: str):
+        self._add(_rating_sql(self.compact), _rating_row(ad_id, rating, reasoning_low, reasoning_high, self.compact))
+
+    def save_listing_details(self, ad_id: str, details: dict):
+        self._add(SAVE_DETAILS_SQL, _details_row(ad_id, details))
+        self._add(UPDATE_ATTRIBUTES_SQL, _attributes_row(ad_id, details))
+
+    def record_job(self, kind, key, stage, run_id=None, error=None):
+        # Marks a page or listing as having reached stage, or as failed at it when error is given
+        self._add(RECORD_JOB_SQL, _job_row(kind, key, stage, run_id, error))
+
+    @property
+    def pending(self):
+        # Rows buffered and not yet committed
+        return self._count
+
+    @contextlib.contextmanager
+    def deferred(self):
+        # Holds back the automatic flushes, so everything buffered inside is written
+        # together by the next flush()
+        self._deferred = True
+        try:
+            yield self
+        finally:
+            self._deferred = False
+
+    def discard(self):
+        # Drops the buffered rows, for callers that redo the work instead of retrying the write
+        self._pending = {}
+        self._count = 0
+        self._buffered_urls.clear()
+
+    def flush_if_due(self):
+        if self._count and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+
+        # Statements run in the order they were first buffered, inside one transaction.
+        # The connection rolls it back on an error and the rows are kept for the next flush.
+        with metrics.timer('db_write'), self.conn:
+            for sql, rows in self._pending.items():
+                self.conn.executemany(sql, rows)
+        metrics.increment('db_rows_written', self._count)
+        self._pending = {}
+        self._count = 0
+        self._buffered_urls.clear()
+
+    def _add(self, sql, row):
+        self._pending.setdefault(sql, []).append(row)
+        self._count += 1
+        if self._deferred:
+            return
+        if self._count >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
 
 def close_db(conn):
     conn.commit()
@@ -0,0 +1,121 @@
+from dataclasses import dataclass
+
+# In-page extraction for listing detail pages. Each site gets one readiness selector
+# to wait for and one script that walks the DOM inside the browser and hands back
+# {'description': ..., 'parameters': {...}} in a single WebDriver round trip.
+#
+# Scripts run through execute_async_script, so they finish by calling the callback
+# Selenium passes as the last argument.
+
+# Shared helpers prepended to every script
+_HELPERS = """
+var done = arguments[arguments.length - 1];
+function text(root, selector) {
+    var el = root.querySelector(selector);
+    return el ? el.innerText.trim() : null;
+}
+function texts(root, selector) {
+    return Array.prototype.map.call(root.querySelectorAll(selector), function (el) {
+        return el.innerText.trim();
+    }).filter(function (value) { return value; });
+}
+"""
+
+STORIA_SCRIPT = _HELPERS + """
+done({
+    description: text(document, '[data-cy="adPageAdDescription"] span') || '',
+    parameters: {}
+});
+"""
+
+OLX_SCRIPT = _HELPERS + """
+var parameters = {};
+var container = document.querySelector('[data-testid="ad-parameters-container"]');
+if (container) {
+    parameters.seller_type = text(container, 'p.css-1los5bp') || 'Unknown';
+    texts(container, 'p.css-1los5bp').forEach(function (value) {
+        var split = value.indexOf(':');
+        if (split >= 0) {
+            parameters[value.slice(0, split).trim()] = value.slice(split + 1).trim();
+        } else {
+            // Entries without a colon, like "Persoana fizica"
+            parameters[value] = true;
+        }
+    });
+} else {
+    parameters.seller_type = 'Unknown';
+}
+
+var features = {};
+document.querySelectorAll('[data-testid="ad-features"]').forEach(function (section) {
+    var name = text(section, 'h3');
+    var items = texts(section, 'li');
+    if (name && items.length) {
+        features[name] = items;
+    }
+});
+if (Object.keys(features).length) {
+    parameters.Features = features;
+}
+
+done({
+    description: text(document, '[data-cy="ad_description"] div.css-19duwlz') || '',
+    parameters: parameters
+});
+"""
+
+AUTOVIT_SCRIPT = _HELPERS + """
+// Expand collapsed equipment sections first, then read everything once they've rendered
+var collapsed = document.querySelectorAll('.ooa-xve46n button[aria-expanded="false"]');
+collapsed.forEach(function (button) { button.click(); });
+
+setTimeout(function () {
+    var parameters = {seller_type: text(document, '.ooa-70qvj9 .ooa-1hl3hwd') || 'Unknown'};
+    ['[data-testid="basic_information"]', '[data-testid="collapsible-groups-wrapper"]'].forEach(function (selector) {
+        var group = document.querySelector(selector);
+        if (!group) {
+            return;
+        }
+        group.querySelectorAll('[data-testid]').forEach(function (row) {
+            var label = text(row, '.eur4qwl8');
+            var value = text(row, '.eur4qwl9');
+            if (label && value !== null) {
+                parameters[label] = value;
+            }
+        });
+    });
+
+    var features = {};
+    document.querySelectorAll('.ooa-xve46n').forEach(function (section) {
+        var button = section.querySelector('button');
+        var name = button ? text(button, '.e1jq34to3') : null;
+        var items = [];
+        for (var sibling = button && button.nextElementSibling; sibling; sibling = sibling.nextElementSibling) {
+            items = items.concat(texts(sibling, 'p.e1jq34to3'));
+        }
+        if (name && items.length) {
+            features[name] = items;
+        }
+    });
+    if (Object.keys(features).length) {
+        parameters.Dotari = features;
+    }
+
+    done({
+        description: text(document, '[data-testid="textWrapper"]') || '',
+        parameters: parameters
+    });
+}, collapsed.length ? 500 : 0);
+"""
+
+@dataclass
+class DetailScript:
+    # CSS selector that marks the page as ready to extract
+    ready: str
+    script: str
+
+DETAIL_SCRIPTS = {
+    'storia': DetailScript(ready='[data-cy="adPageAdDescription"]', script=STORIA_SCRIPT),
+    'olx': DetailScript(ready='[data-cy="ad_description"]', script=OLX_SCRIPT),
+    'autovit': DetailScript(ready='[data-testid="textWrapper"]', script=AUTOVIT_SCRIPT),
+}
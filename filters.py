@@ -0,0 +1,73 @@
+import operator
+from dataclasses import dataclass
+import attributes
+
+# Hard constraints on listings. They become a WHERE clause wherever listings are read from
+# the database, and the same rules are checked in Python for listings already in memory,
+# so excluded listings never reach the browser or the LLM.
+#
+# An unknown value (NULL) passes, since cards often lack fuel or gearbox until the detail
+# page is read, except the price: listings without one are skipped, as they always were.
+
+OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    'IN': lambda actual, allowed: actual in allowed,
+}
+
+@dataclass
+class ListingFilters:
+    min_price: float = None
+    max_price: float = None
+    min_year: int = None
+    max_kilometers: int = None
+    min_horsepower: int = None
+    fuel_types: tuple = ()
+    gearbox_types: tuple = ()
+
+    def __post_init__(self):
+        # Accept the same spellings the sites use ("Benzina", "Automata")
+        self.fuel_types = tuple(attributes.normalize_fuel(value) for value in self.fuel_types if value)
+        self.gearbox_types = tuple(attributes.normalize_gearbox(value) for value in self.gearbox_types if value)
+
+    def conditions(self):
+        # (column, operator, value, whether an unknown value fails)
+        rules = [
+            ('price', '>=', self.min_price, True),
+            ('price', '<=', self.max_price, True),
+            ('age', '>=', self.min_year, False),
+            ('kilometers', '<=', self.max_kilometers, False),
+            ('horsepower', '>=', self.min_horsepower, False),
+            ('fuel', 'IN', self.fuel_types, False),
+            ('gearbox', 'IN', self.gearbox_types, False),
+        ]
+        return [rule for rule in rules if rule[2] not in (None, ())]
+
+    def where(self, alias='a'):
+        # Returns (SQL condition, parameters)
+        clauses, params = [], []
+        for column, op, value, required in self.conditions():
+            column = f'{alias}.{column}' if alias else column
+            if op == 'IN':
+                test = f"{column} IN ({', '.join('?' * len(value))})"
+                params.extend(value)
+            else:
+                test = f'{column} {op} ?'
+                params.append(value)
+            clauses.append(test if required else f'({column} IS NULL OR {test})')
+        return ' AND '.join(clauses) or '1', params
+
+    def matches(self, listing):
+        for column, op, value, required in self.conditions():
+            actual = listing.get(column)
+            if actual is None:
+                if required:
+                    return False
+                continue
+            try:
+                if not OPERATORS[op](actual, value):
+                    return False
+            except TypeError:
+                # Text left in a numeric column by an older scrape
+                return False
+        return True
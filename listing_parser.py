@@ -0,0 +1,294 @@
+from dataclasses import dataclass
+from datetime import datetime
+import os
+import metrics
+import page_state
+
+# lxml is several times faster than the built-in parser, use it when installed
+try:
+    from lxml import html as lxml_html
+    HTML_PARSER = 'lxml'
+except ImportError:
+    lxml_html = None
+    HTML_PARSER = 'html.parser'
+
+# Read cards from the page's embedded JSON state when it's there, the DOM is the fallback
+USE_PAGE_STATE = os.getenv('USE_PAGE_STATE', 'true').lower() == 'true'
+
+# Listing card selectors, in order of preference, with the raw markup that identifies each one
+CARD_SELECTORS = [
+    ('data-cy="l-card"', {'data-cy': 'l-card'}),
+    ('data-testid="l-card"', {'data-testid': 'l-card'}),
+    ('css-l9drzq', {'class': 'css-l9drzq'}),
+]
+
+@dataclass
+class Card:
+    title: str
+    url: str
+    price: str
+    negotiable: str
+    location: str
+    date: str
+    age: int = None
+    kilometers: int = None
+    size: str = "N/A"
+    listing_type: str = "car"
+    # Only in the page state, the rendered cards show just the year and kilometers
+    fuel: str = None
+    gearbox: str = None
+    horsepower: str = None
+    body_type: str = None
+    seller_type: str = None
+
+def romanian_to_standard_date(romanian_date):
+    # Define Romanian month names and their numeric equivalents
+    romanian_months = {
+        'ianuarie': '01', 'februarie': '02', 'martie': '03', 'aprilie': '04',
+        'mai': '05', 'iunie': '06', 'iulie': '07', 'august': '08',
+        'septembrie': '09', 'octombrie': '10', 'noiembrie': '11', 'decembrie': '12'
+    }
+
+    # Split the Romanian date into day, month name, and year
+    parts = romanian_date.split()
+    if len(parts) != 3:
+        raise ValueError("Date must be in the format 'dd month yyyy'")
+
+    day, month_name, year = parts
+
+    # Convert month name to numeric month
+    month = romanian_months.get(month_name.lower())
+    if not month:
+        raise ValueError(f"Unknown month: {month_name}")
+
+    # Format the date in standard format
+    standard_date = f'{day}-{month}-{year} 00:00'
+
+    return standard_date
+
+def _class_xpath(tag, class_name):
+    return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+# XPath equivalents of CARD_SELECTORS and the per-card lookups, for the lxml fast path
+CARD_XPATHS = [
+    '//div[@data-cy="l-card"]',
+    '//div[@data-testid="l-card"]',
+    _class_xpath('div', 'css-l9drzq').replace('.//', '//', 1),
+]
+TITLE_XPATH = _class_xpath('h4', 'css-1g61gc2')
+PRICE_XPATH = './/p[@data-testid="ad-price"]'
+URL_XPATH = _class_xpath('a', 'css-1tqlkj0')
+LOCATION_DATE_XPATH = './/p[@data-testid="location-date"]'
+DETAILS_XPATH = _class_xpath('span', 'css-6as4g5')
+
+def parse_listing_cards(html, parser=HTML_PARSER, use_state=USE_PAGE_STATE):
+    if use_state:
+        with metrics.timer('parse', parser='state'):
+            cards = _parse_cards_state(html)
+        if cards:
+            return cards
+
+    with metrics.timer('parse', parser=parser):
+        if parser == 'lxml':
+            return _parse_cards_lxml(html)
+        return _parse_cards_soup(html, parser)
+
+def _parse_cards_state(html):
+    state = page_state.olx_state(html)
+    try:
+        ads = state['listing']['listing']['ads']
+    except (KeyError, TypeError):
+        return []
+
+    cards = []
+    for ad in ads or []:
+        card = card_from_state(ad)
+        if card:
+            cards.append(card)
+    return cards
+
+def card_from_state(ad):
+    # Maps one ad from OLX's listing state to the same values the DOM path produces
+    try:
+        title = (ad.get('title') or '').strip()
+        ad_url = ad.get('url')
+        if not title or not ad_url:
+            return None
+        if not ad_url.startswith('http'):
+            ad_url = 'https://www.olx.ro' + ad_url
+
+        price_info = ad.get('price') or {}
+        regular_price = price_info.get('regularPrice') or {}
+        value = regular_price.get('value')
+        if value is not None and regular_price.get('currencyCode', 'EUR') == 'EUR':
+            price = str(int(value)) if float(value).is_integer() else str(value)
+        elif price_info.get('displayValue'):
+            price = price_info['displayValue'].replace(" ", "").replace("€", "").replace(",", ".")
+        else:
+            return None
+        negotiable = "Negotiable" if regular_price.get('negotiable') else "Fix"
+
+        location_info = ad.get('location') or {}
+        location = location_info.get('cityName') or "N/A"
+        if location_info.get('districtName'):
+            location = f"{location}, {location_info['districtName']}"
+
+        date_str = datetime.now().strftime("%d-%m-%Y 00:00")
+        refreshed = ad.get('lastRefreshTime') or ad.get('createdTime')
+        if refreshed:
+            date_str = datetime.fromisoformat(refreshed).strftime("%d-%m-%Y %H:%M")
+
+        params = {param.get('key'): param for param in ad.get('params') or []}
+        age = None
+        kilometers = None
+        if 'year' in params:
+            age = int(params['year']['value'])
+        if 'rulaj_pana' in params:
+            kilometers = int(''.join(ch for ch in str(params['rulaj_pana'].get('normalizedValue')) if ch.isdigit()))
+
+        card = Card(title, ad_url, price, negotiable, location, date_str, age, kilometers)
+        card.fuel = (params.get('petrol') or {}).get('value')
+        card.gearbox = (params.get('gearbox') or {}).get('value')
+        card.horsepower = (params.get('enginepower') or {}).get('value')
+        card.body_type = (params.get('car_body') or {}).get('value')
+        if 'isBusiness' in ad:
+            card.seller_type = 'Firma' if ad['isBusiness'] else 'Persoana fizica'
+        return card
+
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"Error processing ad from page state: {str(e)}")
+        return None
+
+def _parse_cards_lxml(html):
+    # Works on the lxml tree directly, avoiding BeautifulSoup's per-node overhead. lxml has
+    # no SoupStrainer, so the page is parsed from the tag holding the first card onwards:
+    # the head, scripts and page state before the cards are most of the markup.
+    for (marker, _), xpath in zip(CARD_SELECTORS, CARD_XPATHS):
+        first = html.find(marker)
+        if first < 0:
+            continue
+        tree = lxml_html.document_fromstring(html[html.rfind('<', 0, first):])
+        ads = tree.xpath(xpath)
+        if ads:
+            cards = []
+            for ad in ads:
+                fields = [_first_lxml(ad, path) for path in (TITLE_XPATH, PRICE_XPATH, URL_XPATH, LOCATION_DATE_XPATH, DETAILS_XPATH)]
+                title, price, url_element, location_date, details = fields
+                card = card_from_fields(
+                    title.text_content() if title is not None else None,
+                    price.text_content() if price is not None else None,
+                    url_element.get('href') if url_element is not None else None,
+                    location_date.text_content() if location_date is not None else None,
+                    details.text_content() if details is not None else None,
+                )
+                if card:
+                    cards.append(card)
+            return cards
+    return []
+
+def _first_lxml(element, xpath):
+    found = element.xpath(xpath)
+    return found[0] if found else None
+
+def _parse_cards_soup(html, parser):
+    # bs4 is only needed when lxml isn't installed, so it's imported here
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # Only the card subtrees are built into a tree, the rest of the page is skipped
+    for marker, attrs in CARD_SELECTORS:
+        if marker not in html:
+            continue
+        soup = BeautifulSoup(html, parser, parse_only=SoupStrainer('div', attrs=attrs))
+        ads = soup.find_all('div', attrs)
+        if ads:
+            cards = []
+            for ad in ads:
+                card = parse_card(ad)
+                if card:
+                    cards.append(card)
+            return cards
+    return []
+
+def parse_card(ad):
+    title_element = ad.find('h4', class_='css-1g61gc2')
+    price_element = ad.find('p', {'data-testid': 'ad-price'})
+    url_element = ad.find('a', class_='css-1tqlkj0')
+    location_date_element = ad.find('p', {'data-testid': 'location-date'})
+    details_element = ad.find('span', class_='css-6as4g5')
+
+    return card_from_fields(
+        title_element.text if title_element else None,
+        price_element.text if price_element else None,
+        url_element.get('href') if url_element else None,
+        location_date_element.text if location_date_element else None,
+        details_element.text if details_element else None,
+    )
+
+def card_from_fields(title, price, href, location_date, details_text):
+    try:
+        # Get the title
+        title = title.strip() if title else None
+        if not title:
+            return None
+
+        # Get the price
+        price = price.strip() if price else None
+        if not price:
+            return None
+
+        # Process price
+        if "Prețul e negociabil" in price:
+            price = price.replace("Prețul e negociabil", "").strip()
+            negotiable = "Negotiable"
+        else:
+            negotiable = "Fix"
+
+        price = price.replace(" ", "").replace("€", "").replace(",", ".")
+
+        # Get the URL
+        ad_url = href
+        if not ad_url:
+            return None
+        if not ad_url.startswith('http'):
+            ad_url = 'https://www.olx.ro' + ad_url
+
+        # Get location and date
+        location = "N/A"
+        date_str = datetime.now().strftime("%d-%m-%Y 00:00")
+
+        if location_date:
+            parts = location_date.strip().split(" - ")
+            if len(parts) >= 2:
+                location = parts[0].strip()
+                date_str = parts[1].strip()
+                date_str = date_str.replace("Reactualizat ", "")
+                if "Azi la" in date_str:
+                    date_str = date_str.replace("Azi la ", datetime.now().strftime("%d-%m-%Y "))
+                else:
+                    date_str = date_str.replace("la", "")
+                    try:
+                        date_str = romanian_to_standard_date(date_str)
+                    except:
+                        pass
+
+        # Try to find car details
+        age = None
+        kilometers = None
+        if details_text:
+            # Extract year and kilometers
+            parts = details_text.strip().split()
+            if len(parts) >= 2:
+                try:
+                    # First part is the year
+                    age = int(parts[0])
+                    # Everything after the year until 'km' is the kilometers
+                    km_text = ' '.join(parts[1:-1])  # Join all parts except the last 'km'
+                    kilometers = int(km_text.replace(' ', '').replace('.', ''))
+                except:
+                    pass
+
+        return Card(title, ad_url, price, negotiable, location, date_str, age, kilometers)
+
+    except Exception as e:
+        print(f"Error processing ad: {str(e)}")
+        return None
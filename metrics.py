@@ -0,0 +1,200 @@
+import bisect
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Collects per-stage timings and counters for a run and exports them as a JSON
+# summary or a Prometheus text file. Once configure_logging() is called with a
+# path, every stage timing is also logged there as a JSON line.
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 120)
+
+# Samples kept per series for percentiles, a uniform reservoir over the whole run
+MAX_SAMPLES = 10000
+
+logger = logging.getLogger('adsai.metrics')
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname, 'event': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, ensure_ascii=False)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = []
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            # Reservoir sampling: every value observed so far has the same chance of being kept
+            slot = random.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = value
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 4),
+            'mean': round(self.total / self.count, 4) if self.count else None,
+            'min': round(self.min, 4) if self.min is not None else None,
+            'p50': round(self.percentile(0.5), 4) if self.samples else None,
+            'p95': round(self.percentile(0.95), 4) if self.samples else None,
+            'max': round(self.max, 4) if self.max is not None else None,
+        }
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._profile_dir = None
+        self._profiles = {}
+        self._profiling = threading.local()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        profile = self._start_profile()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stop_profile(stage, profile)
+            self.observe(stage, elapsed, **labels)
+            if logger.handlers:
+                logger.info('stage', extra={'fields': {'stage': stage, 'seconds': round(elapsed, 4), **labels}})
+
+    def enable_profiling(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._profile_dir = directory
+
+    def _start_profile(self):
+        # Only the outermost timer in each thread profiles, nested profilers can't run together
+        if not self._profile_dir or getattr(self._profiling, 'active', False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already running (Python 3.12+ allows one at a time)
+            return None
+        self._profiling.active = True
+        return profile
+
+    def _stop_profile(self, stage, profile):
+        if profile is None:
+            return
+        profile.disable()
+        self._profiling.active = False
+        with self._lock:
+            stats = self._profiles.get(stage)
+            if stats is None:
+                self._profiles[stage] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+    def dump_profiles(self):
+        with self._lock:
+            for stage, stats in self._profiles.items():
+                stats.dump_stats(os.path.join(self._profile_dir, f'{stage}.prof'))
+        if self._profiles:
+            print(f"Wrote {len(self._profiles)} stage profiles to {self._profile_dir}")
+
+    def summary(self):
+        with self._lock:
+            return {
+                'duration_seconds': round(time.time() - self.started_at, 3),
+                'stages': [
+                    {'stage': name, **dict(labels), **histogram.summary()}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+                'counters': [
+                    {'name': name, **dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+            }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_prometheus(self, path):
+        lines = ['# TYPE adsai_stage_seconds histogram']
+        with self._lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                base = _labels({'stage': name, **dict(labels)})
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'adsai_stage_seconds_bucket{_labels({"stage": name, **dict(labels), "le": bound})} {cumulative}')
+                lines.append(f'adsai_stage_seconds_sum{base} {histogram.total}')
+                lines.append(f'adsai_stage_seconds_count{base} {histogram.count}')
+
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE adsai_{name}_total counter')
+                    typed.add(name)
+                lines.append(f'adsai_{name}_total{_labels(dict(labels))} {value}')
+
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+def configure_logging(path):
+    if not path or logger.handlers:
+        return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Process-wide registry used by the instrumented modules
+registry = Registry()
+timer = registry.timer
+observe = registry.observe
+increment = registry.increment
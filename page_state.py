@@ -0,0 +1,124 @@
+import html as html_lib
+import json
+import re
+
+# OLX, Autovit and Storia ship each page's data as a JSON blob next to the markup
+# (OLX as window.__PRERENDERED_STATE__, the Next.js sites as __NEXT_DATA__). Reading
+# that is much faster than walking the DOM and doesn't depend on hashed class names.
+# Every helper returns None when the blob is missing or shaped differently, so
+# callers can fall back to the DOM.
+
+# orjson parses these multi-megabyte blobs several times faster, use it when installed
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+OLX_STATE_MARKER = 'window.__PRERENDERED_STATE__'
+NEXT_DATA_MARKER = '<script id="__NEXT_DATA__" type="application/json">'
+
+_decoder = json.JSONDecoder()
+_BREAKS = re.compile(r'<br\s*/?>|</p>|</li>', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]+>')
+
+def olx_state(html):
+    start = html.find(OLX_STATE_MARKER)
+    if start < 0:
+        return None
+    start = html.find('=', start) + 1
+    # Skip whitespace, raw_decode doesn't
+    while start < len(html) and html[start].isspace():
+        start += 1
+    try:
+        # The state is a JSON document inside a JS string literal, so it's decoded twice. Only
+        # the literal is read, statements after it in the same script are left alone.
+        state, _ = _decoder.raw_decode(html, start)
+        if isinstance(state, str):
+            state = loads(state)
+    except (ValueError, TypeError):
+        return None
+    return state if isinstance(state, dict) else None
+
+def next_data(html):
+    start = html.find(NEXT_DATA_MARKER)
+    if start < 0:
+        return None
+    start += len(NEXT_DATA_MARKER)
+    end = html.find('</script>', start)
+    try:
+        data = loads(html[start:end])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def html_to_text(value):
+    # Descriptions are stored as HTML, the DOM path used the rendered text
+    if not value:
+        return ""
+    text = html_lib.unescape(_TAGS.sub('', _BREAKS.sub('\n', value)))
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+def olx_details(state):
+    ad = state['ad']['ad']
+    parameters = {'seller_type': 'Firma' if ad.get('isBusiness') else 'Persoana fizica'}
+    for param in ad.get('params') or []:
+        parameters[param['name']] = param['value']
+    return {
+        'description': html_to_text(ad.get('description')),
+        'parameters': parameters
+    }
+
+def autovit_details(data):
+    advert = data['props']['pageProps']['advert']
+    seller = advert.get('seller') or {}
+    parameters = {'seller_type': 'Persoana fizica' if seller.get('type') == 'PRIVATE' else 'Firma'}
+    for detail in advert.get('details') or []:
+        parameters[detail['label']] = detail['value']
+
+    features = {}
+    for group in advert.get('equipment') or []:
+        values = [value['label'] for value in group.get('values') or []]
+        if values:
+            features[group['label']] = values
+    if features:
+        parameters['Dotari'] = features
+
+    return {
+        'description': html_to_text(advert.get('description')),
+        'parameters': parameters
+    }
+
+def storia_details(data):
+    ad = data['props']['pageProps']['ad']
+    parameters = {}
+    for characteristic in ad.get('characteristics') or []:
+        parameters[characteristic['label']] = characteristic.get('localizedValue') or characteristic['value']
+    return {
+        'description': html_to_text(ad.get('description')),
+        'parameters': parameters
+    }
+
+# Per-site (state extractor, details mapper) pairs
+DETAIL_ADAPTERS = {
+    'olx': (olx_state, olx_details),
+    'autovit': (next_data, autovit_details),
+    'storia': (next_data, storia_details),
+}
+
+def parse_details(site, html):
+    # Returns the same {'description', 'parameters'} dict the browser scraper builds, or None
+    adapter = DETAIL_ADAPTERS.get(site)
+    if adapter is None or not html:
+        return None
+    extract, build = adapter
+    state = extract(html)
+    if state is None:
+        return None
+    try:
+        details = build(state)
+    except (KeyError, TypeError, AttributeError):
+        return None
+    if not details['description'] and not details['parameters']:
+        return None
+    return details
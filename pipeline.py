@@ -0,0 +1,309 @@
+import os
+import queue
+import threading
+import attributes
+import db
+import ai
+import prefilter
+
+# Worker counts per stage and the size of the queues between them. Each rating worker
+# keeps one LLM request in flight, so by default there are LLM_CONCURRENCY of them.
+DETAIL_WORKERS = int(os.getenv('DETAIL_WORKERS', '1'))
+RATING_WORKERS = int(os.getenv('RATING_WORKERS', str(ai.LLM_CONCURRENCY)))
+QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '8'))
+
+# Seconds a rating worker waits for more listings to fill a batch (see RATING_BATCH_SIZE)
+RATING_BATCH_WAIT = float(os.getenv('RATING_BATCH_WAIT', '2'))
+
+# How long stored detail pages are reused before the listing is scraped again
+DETAILS_TTL_HOURS = float(os.getenv('DETAILS_TTL_HOURS', '168'))
+
+# Sentinel telling a worker that its input queue is drained
+_STOP = object()
+
+class Pipeline:
+    # Runs detail scraping, rating and saving as separate stages connected by
+    # bounded queues, so browser work overlaps with LLM inference. A full queue
+    # blocks the stage feeding it, which keeps memory flat on large runs.
+    def __init__(self, preferences, llm=None, detail_workers=DETAIL_WORKERS,
+                 rating_workers=RATING_WORKERS, queue_size=QUEUE_SIZE, listing_filters=None, run_id=None,
+                 use_prefilter=True, dedupe=True, dedupe_limit=None):
+        self.preferences = preferences
+        # Each listing's progress is recorded in the jobs table under this run, unless submit gives another
+        self.run_id = run_id
+        # Checked again once detail pages add fuel, gearbox and power the cards didn't show
+        self.listing_filters = listing_filters
+        # Created on first use when not given, so runs with nothing to rate never load the client
+        self.llm = llm
+        self._llm_lock = threading.Lock()
+        self.detail_workers = max(1, detail_workers)
+        self.rating_workers = max(1, rating_workers)
+        self.rating_batch_size = ai.rating_batch_size(preferences)
+
+        # With the pre-filter on, scraped listings are held until every detail page is in,
+        # then ranked together and only the best ones are queued for rating
+        self.prefilter = prefilter.Prefilter(preferences, self._get_llm) if use_prefilter and prefilter.enabled() else None
+        self._candidates = []
+
+        self.detail_queue = queue.Queue(maxsize=queue_size)
+        self.rating_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        # Without dedupe a listing can be submitted again, e.g. when a queue worker re-claims it after a failure.
+        # With dedupe_limit only the latest submitted ids are remembered, for long-running processes.
+        self.dedupe = dedupe
+        self.dedupe_limit = dedupe_limit
+        self.submitted = {}
+        self.queued = 0
+        self.saved = 0
+        self.failed = 0
+        self.skipped = 0
+        self.excluded = 0
+        self._stats_lock = threading.Lock()
+
+        # Listings handed over with offer() wait here, unbounded, until the feeder thread submits them
+        self._inbox = queue.Queue()
+
+        self._detail_threads = []
+        self._rating_threads = []
+        self._writer_thread = None
+        self._feeder_thread = None
+
+    def start(self):
+        self._detail_threads = [
+            threading.Thread(target=self._detail_worker, name=f"detail-{i}", daemon=True)
+            for i in range(self.detail_workers)
+        ]
+        self._rating_threads = [
+            threading.Thread(target=self._rating_worker, name=f"rating-{i}", daemon=True)
+            for i in range(self.rating_workers)
+        ]
+        self._writer_thread = threading.Thread(target=self._writer, name="db-writer", daemon=True)
+        self._feeder_thread = threading.Thread(target=self._feeder, name="feeder", daemon=True)
+
+        if self.rating_batch_size > 1:
+            print(f"Rating up to {self.rating_batch_size} listings per LLM request")
+        for thread in self._detail_threads + self._rating_threads + [self._writer_thread, self._feeder_thread]:
+            thread.start()
+
+    def submit(self, listing, run_id=None):
+        # Blocks while the detail queue is full. The listing carries its run along the stages,
+        # so a long-lived pipeline can take listings from several runs at once.
+        with self._stats_lock:
+            if self.dedupe and listing['id'] in self.submitted:
+                return False
+            self.submitted[listing['id']] = True
+            if self.dedupe_limit and len(self.submitted) > self.dedupe_limit:
+                del self.submitted[next(iter(self.submitted))]
+            self.queued += 1
+        self.detail_queue.put({**listing, 'run_id': self.run_id if run_id is None else run_id})
+        return True
+
+    def offer(self, listing, run_id=None):
+        # Like submit, but returns at once: the listing is submitted by the feeder thread, so
+        # callers such as the daemon's poll loop never wait for the rating stage to catch up
+        self._inbox.put((listing, run_id))
+
+    def _feeder(self):
+        while True:
+            item = self._inbox.get()
+            if item is _STOP:
+                break
+            self.submit(*item)
+
+    def close(self):
+        # Drain the stages in order so every submitted listing is finished
+        self._inbox.put(_STOP)
+        self._feeder_thread.join()
+        for _ in self._detail_threads:
+            self.detail_queue.put(_STOP)
+        for thread in self._detail_threads:
+            thread.join()
+
+        if self.prefilter:
+            self._queue_prefiltered()
+
+        for _ in self._rating_threads:
+            self.rating_queue.put(_STOP)
+        for thread in self._rating_threads:
+            thread.join()
+
+        self.write_queue.put(_STOP)
+        self._writer_thread.join()
+
+        print(f"\nPipeline finished: {self.queued} queued, {self.saved} rated, {self.failed} failed, "
+              f"{self.excluded} excluded by filters"
+              + (f", {self.skipped} skipped by the pre-filter" if self.prefilter else ""))
+
+        # Runs that never rated anything don't open the cache just to report on it
+        cache = ai.get_rating_cache(create=False)
+        if cache:
+            print(f"Rating cache: {cache.stats()}")
+
+    def _count_failure(self, listing=None, stage=None, error=None):
+        # With a listing, the failure is also recorded so it counts towards db.JOB_MAX_ATTEMPTS
+        with self._stats_lock:
+            self.failed += 1
+        if listing is not None:
+            self.write_queue.put(('failed', listing, (stage, error)))
+
+    def _detail_worker(self):
+        # Each worker reads stored details through its own connection
+        conn, c = db.setup_db()
+        try:
+            while True:
+                listing = self.detail_queue.get()
+                if listing is _STOP:
+                    break
+
+                url = listing['url']
+                details = db.get_listing_details(c, listing['id'], max_age_seconds=DETAILS_TTL_HOURS * 3600)
+                if details:
+                    print(f"Using stored details for {url}")
+                    self._queue_rating(listing, details)
+                    continue
+
+                error = "no details found on the page"
+                try:
+                    details = ai.scrape_detailed_data(url)
+                except Exception as e:
+                    print(f"Error scraping details for {url}: {str(e)}")
+                    details = None
+                    error = str(e)
+
+                if not details:
+                    print(f"Skipping listing due to scraping issues: {url}")
+                    self._count_failure(listing, 'details', error)
+                    continue
+
+                self.write_queue.put(('details', listing, details))
+                self._queue_rating(listing, details)
+        finally:
+            conn.close()
+
+    def _queue_rating(self, listing, details):
+        if self.listing_filters and not self.listing_filters.matches({**listing, **attributes.details_attributes(details)}):
+            print(f"Skipping listing outside the filters: {listing['url']}")
+            with self._stats_lock:
+                self.excluded += 1
+            return
+        if self.prefilter is None:
+            self.rating_queue.put((listing, details))
+            return
+        with self._stats_lock:
+            self._candidates.append((listing, details))
+
+    def _queue_prefiltered(self):
+        candidates, self._candidates = self._candidates, []
+        try:
+            selected = self.prefilter.select(candidates)
+        except Exception as e:
+            print(f"Pre-filter failed, rating every listing: {str(e)}")
+            selected = candidates
+        self.skipped = len(candidates) - len(selected)
+        for item in selected:
+            self.rating_queue.put(item)
+
+    def _get_llm(self):
+        with self._llm_lock:
+            if self.llm is None:
+                self.llm = ai.get_llm()
+            return self.llm
+
+    def _rating_worker(self):
+        stopping = False
+        while not stopping:
+            item = self.rating_queue.get()
+            if item is _STOP:
+                break
+
+            # Top the batch up with listings that arrive shortly after
+            batch = [item]
+            while len(batch) < self.rating_batch_size:
+                try:
+                    item = self.rating_queue.get(timeout=RATING_BATCH_WAIT)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            for (listing, details), result in zip(batch, self._rate(batch)):
+                if len(result) != 3:
+                    print(f"Rating failed for {listing['url']}: {result[1]}")
+                    self._count_failure(listing, 'rated', result[1])
+                    continue
+
+                self.write_queue.put(('rating', listing, result))
+
+    def _rate(self, batch):
+        try:
+            if len(batch) == 1:
+                listing, details = batch[0]
+                return [ai.calculate_rating(listing, details, self.preferences, self._get_llm())]
+            return ai.calculate_ratings(batch, self.preferences, self._get_llm())
+        except Exception as e:
+            return [(0, f"Error: {str(e)}")] * len(batch)
+
+    def _writer(self):
+        # SQLite connections can't be shared across threads, so the writer owns its own
+        conn, c = db.setup_db()
+        writer = db.BatchWriter(conn)
+        # Ratings buffered in the writer, they count as saved once a flush commits them
+        unsaved = []
+        try:
+            while True:
+                try:
+                    item = self.write_queue.get(timeout=writer.flush_interval)
+                except queue.Empty:
+                    # Nothing new arrived, don't keep buffered rows waiting
+                    self._flush(writer)
+                    self._report_saved(writer, unsaved)
+                    continue
+                if item is _STOP:
+                    break
+
+                kind, listing, payload = item
+                try:
+                    if kind == 'failed':
+                        stage, error = payload
+                        writer.record_job('listing', listing['id'], stage, listing['run_id'], error=error)
+                    elif kind == 'details':
+                        writer.save_listing_details(listing['id'], payload)
+                        writer.record_job('listing', listing['id'], 'details', listing['run_id'])
+                    else:
+                        unsaved.append((listing, payload))
+                        writer.save_rating(listing['id'], *payload)
+                        writer.record_job('listing', listing['id'], 'rated', listing['run_id'])
+                except Exception as e:
+                    # A failed flush keeps its rows buffered, the next one retries them
+                    print(f"Error writing to database for {listing['url']}: {str(e)}")
+                self._report_saved(writer, unsaved)
+        finally:
+            self._flush(writer)
+            self._report_saved(writer, unsaved)
+            for listing, _ in unsaved:
+                print(f"Rating for {listing['url']} could not be saved")
+                self._count_failure()
+            db.close_db(conn)
+
+    def _report_saved(self, writer, unsaved):
+        if writer.pending:
+            return
+        for listing, (rating, lowest_rated, highest_rated) in unsaved:
+            self.saved += 1
+            print(f"\nListing: {listing['url']}")
+            print(f"Title: {listing['title']}")
+            print(f"Price: {listing['price']} EUR")
+            print(f"Rating: {rating}/10")
+            print(f"Reasoning (Low): {lowest_rated}")
+            print(f"Reasoning (High): {highest_rated}")
+            print("-" * 50)
+        unsaved.clear()
+
+    def _flush(self, writer):
+        try:
+            writer.flush()
+        except Exception as e:
+            print(f"Error writing to database: {str(e)}")
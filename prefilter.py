@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+from collections import Counter
+import numpy as np
+import db
+import metrics
+import prompts
+
+# Ranks scraped listings by how close their title and description are to PREFERENCES,
+# so only the most promising ones are sent to the LLM. Listings are embedded through the
+# OpenAI-compatible /v1/embeddings endpoint (LM Studio), with a local TF-IDF fallback,
+# and every listing is compared to the preferences in one NumPy matrix-vector product.
+
+# Keep the N most similar listings (0 = no limit) and/or those at or above a cosine
+# similarity, the pre-filter is off while both are 0
+PREFILTER_TOP_N = int(os.getenv('PREFILTER_TOP_N', '0'))
+PREFILTER_MIN_SIMILARITY = float(os.getenv('PREFILTER_MIN_SIMILARITY', '0'))
+
+# Embedding model loaded in LM Studio, leave empty to always use TF-IDF
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', '')
+
+# Texts sent per embeddings request
+EMBEDDING_BATCH_SIZE = 64
+
+# Most embedding models only read the first 512 tokens
+EMBEDDING_MAX_TOKENS = 512
+
+# Size of the hashed TF-IDF vectors
+TFIDF_DIMENSIONS = 4096
+
+_WORDS = re.compile(r'\w{2,}')
+
+def enabled():
+    return PREFILTER_TOP_N > 0 or PREFILTER_MIN_SIMILARITY > 0
+
+def listing_text(listing, details):
+    text = f"{listing['title']}\n{(details or {}).get('description') or ''}"
+    text, _ = prompts.truncate_to_tokens(prompts.normalize_whitespace(text), EMBEDDING_MAX_TOKENS)
+    return text
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def cosine_similarities(matrix, query):
+    # Every row against the query at once, rows or queries of all zeros score 0
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    return np.divide(matrix @ query, norms, out=np.zeros(len(matrix), dtype=np.float32), where=norms > 0)
+
+def _tokens(text):
+    # Preferences are often typed without diacritics, so "cutie automată" matches "cutie automata"
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return _WORDS.findall(''.join(ch for ch in text if not unicodedata.combining(ch)))
+
+def tfidf_vectors(texts, dimensions=TFIDF_DIMENSIONS):
+    # Words are hashed into a fixed number of columns, so no vocabulary is kept. IDF comes
+    # from the texts passed in, which makes the vectors comparable only within one call.
+    counts = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token, count in Counter(_tokens(text)).items():
+            counts[row, zlib.crc32(token.encode('utf-8')) % dimensions] += count
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+    return np.log1p(counts) * idf
+
+def embed(llm, texts, model=EMBEDDING_MODEL):
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        with metrics.timer('embedding_request'):
+            response = llm.embeddings.create(model=model, input=texts[start:start + EMBEDDING_BATCH_SIZE])
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return np.asarray(vectors, dtype=np.float32)
+
+class Prefilter:
+    # Scores (listing, details) pairs against the preferences and keeps the best ones.
+    # get_llm is only called when embeddings are needed.
+    def __init__(self, preferences, get_llm, top_n=PREFILTER_TOP_N,
+                 min_similarity=PREFILTER_MIN_SIMILARITY, model=EMBEDDING_MODEL):
+        self.preferences_text = prompts.normalize_whitespace(preferences.description or '')
+        self.get_llm = get_llm
+        self.top_n = top_n
+        self.min_similarity = min_similarity
+        self.model = model
+
+    def select(self, items):
+        # Returns the kept items, most similar first
+        if not items or not self.preferences_text:
+            return items
+
+        texts = [listing_text(listing, details) for listing, details in items]
+        scores, method = self.score(items, texts)
+
+        ranked = [int(index) for index in np.argsort(-scores, kind='stable')]
+        kept = [index for index in ranked if scores[index] >= self.min_similarity]
+        if self.top_n:
+            kept = kept[:self.top_n]
+
+        metrics.increment('prefilter_skipped', len(items) - len(kept))
+        if kept:
+            print(f"Pre-filter ({method}): rating {len(kept)} of {len(items)} listings, "
+                  f"similarity {scores[kept[-1]]:.3f} to {scores[kept[0]]:.3f}")
+        else:
+            print(f"Pre-filter ({method}): none of {len(items)} listings reached similarity {self.min_similarity}")
+        return [items[index] for index in kept]
+
+    def score(self, items, texts):
+        # Returns (cosine similarities, method name)
+        if self.model:
+            try:
+                return self._embedding_scores(items, texts), 'embeddings'
+            except Exception as e:
+                print(f"Could not embed listings ({str(e)}), ranking with TF-IDF instead")
+
+        with metrics.timer('prefilter', method='tfidf'):
+            vectors = tfidf_vectors(texts + [self.preferences_text])
+            return cosine_similarities(vectors[:-1], vectors[-1]), 'tfidf'
+
+    def _embedding_scores(self, items, texts):
+        ad_ids = [listing['id'] for listing, _ in items]
+        hashes = [text_hash(text) for text in texts]
+
+        conn, c = db.setup_db()
+        try:
+            # Stored vectors are reused while the listing's text is unchanged
+            stored = db.get_embeddings(c, ad_ids, self.model)
+            vectors = [None] * len(items)
+            missing = []
+            for index, ad_id in enumerate(ad_ids):
+                entry = stored.get(ad_id)
+                if entry and entry[0] == hashes[index]:
+                    vectors[index] = np.frombuffer(entry[1], dtype=np.float32)
+                else:
+                    missing.append(index)
+
+            # The preferences go in the same requests as the listings that need embedding
+            computed = embed(self.get_llm(), [texts[index] for index in missing] + [self.preferences_text], self.model)
+            db.save_embeddings(conn, self.model, [
+                (ad_ids[index], hashes[index], computed[row].tobytes()) for row, index in enumerate(missing)
+            ])
+        finally:
+            conn.close()
+
+        metrics.increment('embeddings_computed', len(missing))
+        metrics.increment('embeddings_reused', len(items) - len(missing))
+        for row, index in enumerate(missing):
+            vectors[index] = computed[row]
+
+        with metrics.timer('prefilter', method='embeddings'):
+            return cosine_similarities(np.vstack(vectors), computed[-1])
@@ -0,0 +1,132 @@
+import math
+import os
+import re
+
+# Builds the rating prompts. Everything that is the same for every listing (instructions and
+# the buyer's preferences) goes in the system message, so local servers like LM Studio and
+# llama.cpp can reuse the KV cache for that prefix, and only the listing itself is new text.
+
+# Token budget for the listing part of each prompt (details, parameters and description)
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '1024'))
+
+# Share of the budget parameters may use before the description gets the rest
+PARAMETERS_BUDGET_SHARE = 0.4
+
+# Rough characters per token for Romanian/English text, there's no tokenizer for local models here
+CHARS_PER_TOKEN = 3.5
+
+SYSTEM_PROMPT = """You are an AI that rates car listings based on user preferences. Each rating should provide a unique perspective, focusing on different aspects of the car.
+
+Rate each car from 0 to 10 based on these requirements:
+{preferences}
+
+Please provide unique perspectives in your reasoning, focusing on different aspects of the car."""
+
+_SPACES = re.compile(r'[ \t\xa0]+')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def normalize_whitespace(text):
+    lines = [_SPACES.sub(' ', line).strip() for line in (text or '').splitlines()]
+    return '\n'.join(line for line in lines if line)
+
+def dedupe_sentences(text):
+    # Sellers often paste the same sentence several times, keep the first copy
+    seen = set()
+    lines = []
+    for line in text.splitlines():
+        sentences = []
+        for sentence in _SENTENCE_END.split(line):
+            key = sentence.casefold().strip(' .!?')
+            if key and key not in seen:
+                seen.add(key)
+                sentences.append(sentence)
+        if sentences:
+            lines.append(' '.join(sentences))
+    return '\n'.join(lines)
+
+def truncate_to_tokens(text, max_tokens):
+    # Cuts at the last sentence end (or word) that fits, returns (text, truncated)
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text, False
+    if max_chars <= 0:
+        return "", True
+
+    cut = text[:max_chars]
+    boundary = max(cut.rfind('. '), cut.rfind('! '), cut.rfind('? '), cut.rfind('\n'))
+    if boundary >= max_chars // 2:
+        cut = cut[:boundary + 1]
+    elif ' ' in cut:
+        cut = cut[:cut.rfind(' ')]
+    return cut.rstrip() + ' [...]', True
+
+def format_parameters(parameters):
+    lines = []
+    values = {str(value).casefold() for value in parameters.values() if not isinstance(value, (bool, dict))}
+    for key, value in parameters.items():
+        if isinstance(value, bool):
+            # Flags like "Persoana fizica" are often repeated as the seller type
+            if value and str(key).casefold() not in values:
+                lines.append(f"- {key}")
+        elif isinstance(value, dict):
+            # Equipment groups, one compact line per group
+            for group, items in value.items():
+                items = items if isinstance(items, list) else [items]
+                lines.append(f"- {key} / {group}: {', '.join(str(item) for item in items)}")
+        else:
+            lines.append(f"- {key}: {normalize_whitespace(str(value))}")
+    return lines
+
+def build_system_prompt(preferences):
+    return SYSTEM_PROMPT.format(preferences=normalize_whitespace(preferences))
+
+def build_listing_prompt(listing, details, budget=PROMPT_TOKEN_BUDGET):
+    # Returns (prompt, estimated tokens, truncated)
+    header = "\n".join([
+        "Car details:",
+        f"Title: {normalize_whitespace(str(listing['title']))}",
+        f"Price: {listing['price']} EUR",
+        f"Location: {listing['location']}",
+        f"Year: {listing['age']}",
+        f"Kilometers: {listing['kilometers']} km",
+    ])
+    remaining = budget - estimate_tokens(header)
+    truncated = False
+
+    # Parameters are kept line by line up to their share of the budget
+    parameter_lines = format_parameters(details.get('parameters') or {})
+    kept = []
+    parameters_budget = int(budget * PARAMETERS_BUDGET_SHARE)
+    for line in parameter_lines:
+        cost = estimate_tokens(line) + 1
+        if cost > parameters_budget:
+            truncated = True
+            kept.append(f"- ({len(parameter_lines) - len(kept)} more parameters omitted)")
+            break
+        kept.append(line)
+        parameters_budget -= cost
+    parameters_text = ""
+    if kept:
+        parameters_text = "\n\nAdditional Parameters:\n" + "\n".join(kept)
+        remaining -= estimate_tokens(parameters_text)
+
+    # The description gets whatever is left
+    description = dedupe_sentences(normalize_whitespace(details.get('description') or ''))
+    description, description_truncated = truncate_to_tokens(description, remaining - 10)
+    truncated = truncated or description_truncated
+
+    prompt = f"{header}{parameters_text}\n\nAdditional description:\n{description}"
+    return prompt, estimate_tokens(prompt), truncated
+
+def build_batch_prompt(entries):
+    # entries is a list of (ad_id, listing prompt) pairs
+    sections = [
+        f"Rate each of the following {len(entries)} cars separately. Call rate_cars once with one entry "
+        f"per car, using the ad_id shown above each car."
+    ]
+    for ad_id, listing_prompt in entries:
+        sections.append(f"=== ad_id: {ad_id} ===\n{listing_prompt}")
+    return "\n\n".join(sections)
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse
+import metrics
+
+# Requests per second allowed per hostname (0 disables limiting), how many can be made
+# back to back, and how long a host is paused after it starts throttling us
+RATE_LIMIT_PER_SEC = float(os.getenv('RATE_LIMIT_PER_SEC', '1'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '3'))
+RATE_LIMIT_PENALTY = float(os.getenv('RATE_LIMIT_PENALTY', '10'))
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is available and returns the seconds spent waiting
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.blocked_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.blocked_until - now
+            time.sleep(delay)
+            waited += delay
+
+    def penalize(self, seconds):
+        # Empty the bucket and pause it, tokens only start refilling after the pause
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = max(self.updated, self.blocked_until)
+
+class DomainRateLimiter:
+    # One token bucket per hostname, shared by every thread that fetches pages
+    def __init__(self, rate=RATE_LIMIT_PER_SEC, burst=RATE_LIMIT_BURST, penalty=RATE_LIMIT_PENALTY):
+        self.rate = rate
+        self.burst = burst
+        self.penalty = penalty
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, url):
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return host, bucket
+
+    def wait(self, url):
+        host, bucket = self._bucket(url)
+        waited = bucket.acquire()
+        if waited:
+            metrics.observe('rate_limit_wait', waited, host=host)
+        return waited
+
+    def penalize(self, url, seconds=None):
+        host, bucket = self._bucket(url)
+        seconds = self.penalty if seconds is None else seconds
+        print(f"Backing off {host} for {seconds:.0f}s")
+        metrics.increment('rate_limit_penalties', host=host)
+        bucket.penalize(seconds)
+
+# Shared by results and detail page scraping
+limiter = DomainRateLimiter()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import db
+
+# Rating cache settings
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '50000'))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv('LLM_CACHE_MAX_AGE_DAYS', '30'))
+
+# How many writes happen between eviction passes
+EVICT_EVERY = 100
+
+class RatingCache:
+    # Stores parsed rating results keyed by a hash of everything that affects the
+    # completion, so unchanged prompts cost a lookup instead of an LLM call
+    def __init__(self, db_path=db.DB_NAME, max_entries=LLM_CACHE_MAX_ENTRIES, max_age_days=LLM_CACHE_MAX_AGE_DAYS):
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        # Shared by the rating worker threads, guarded by the lock. Same journal and busy timeout
+        # as the other connections, so processes sharing the file wait for each other's writes.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        db.apply_pragmas(self.conn)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT,
+                created_at REAL,
+                last_used_at REAL,
+                hit_count INT DEFAULT 0
+            )
+        ''')
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        payload = {
+            'model': request.get('model'),
+            'messages': request.get('messages'),
+            'tools': request.get('tools'),
+            'temperature': request.get('temperature'),
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT result, created_at FROM llm_cache WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+
+            self.conn.execute(
+                'UPDATE llm_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE key = ?',
+                (now, key)
+            )
+            self.conn.commit()
+            self.hits += 1
+            return tuple(json.loads(row[0]))
+
+    def put(self, key: str, result):
+        now = time.time()
+        with self._lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO llm_cache (key, result, created_at, last_used_at, hit_count)
+                VALUES (?, ?, ?, ?, 0)
+            ''', (key, json.dumps(list(result), ensure_ascii=False), now, now))
+            self.conn.commit()
+
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now):
+        # Drop expired entries, then the least recently used ones above the size limit
+        if self.max_age:
+            self.conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - self.max_age,))
+        if self.max_entries:
+            self.conn.execute('''
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+        self.conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self.conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,110 @@
+import heapq
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+# Poll schedule for the daemon (python app.py daemon). Each search is polled again after an
+# interval that follows its recent yield of new ads: the interval aims to find about
+# DAEMON_TARGET_NEW_ADS new ads per poll, so busy searches are polled often and quiet
+# ones rarely, always within the search's min and max interval.
+
+# JSON list of searches, see the README. Without it the daemon watches BASE_URL.
+SEARCHES_FILE = os.getenv('SEARCHES_FILE', '')
+
+# Default bounds on the poll interval in seconds, searches can override them
+DAEMON_MIN_INTERVAL = float(os.getenv('DAEMON_MIN_INTERVAL', '300'))
+DAEMON_MAX_INTERVAL = float(os.getenv('DAEMON_MAX_INTERVAL', '3600'))
+
+# New ads a poll should find on average
+DAEMON_TARGET_NEW_ADS = float(os.getenv('DAEMON_TARGET_NEW_ADS', '5'))
+
+# Weight of the latest poll in the new-ads rate, the rest is the earlier average
+RATE_SMOOTHING = 0.5
+
+# Listing ids the daemon's pipeline remembers for dedupe, so its memory stays flat
+DAEMON_DEDUPE_LIMIT = 10000
+
+@dataclass
+class Search:
+    name: str
+    url: str
+    max_pages: int
+    min_interval: float = DAEMON_MIN_INTERVAL
+    max_interval: float = DAEMON_MAX_INTERVAL
+    # New ads per second, smoothed over recent polls (None until the second poll)
+    rate: float = None
+    interval: float = None
+    last_poll: float = None
+    next_poll: float = 0
+    polls: int = 0
+    new_ads: int = 0
+
+    def __post_init__(self):
+        if self.interval is None:
+            self.interval = self.min_interval
+
+    def record_poll(self, new_ads, now=None):
+        # Updates the rate and schedules the next poll, returns the new interval
+        now = now or time.time()
+        # The first poll finds the search's whole backlog, which says nothing about its pace
+        if self.last_poll is not None:
+            observed = new_ads / max(now - self.last_poll, 1)
+            self.rate = observed if self.rate is None else RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * self.rate
+            wanted = DAEMON_TARGET_NEW_ADS / self.rate if self.rate > 0 else self.max_interval
+            self.interval = min(self.max_interval, max(self.min_interval, wanted))
+
+        self.polls += 1
+        self.new_ads += new_ads
+        self.last_poll = now
+        self.next_poll = now + self.interval
+        return self.interval
+
+def load_searches(default_url, default_pages, path=SEARCHES_FILE):
+    # Reads SEARCHES_FILE, a JSON list of {"name", "url", "max_pages", "min_interval", "max_interval"}
+    # objects where only url is required, or falls back to the single BASE_URL search
+    if not path:
+        if not default_url:
+            raise ValueError("Set SEARCHES_FILE or BASE_URL to tell the daemon what to watch")
+        return [Search(name='default', url=default_url, max_pages=default_pages)]
+
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+
+    searches = []
+    for index, entry in enumerate(entries, 1):
+        if not entry.get('url'):
+            raise ValueError(f"Search {index} in {path} has no url")
+        searches.append(Search(
+            name=entry.get('name') or f'search-{index}',
+            url=entry['url'],
+            max_pages=int(entry.get('max_pages', default_pages)),
+            min_interval=float(entry.get('min_interval', DAEMON_MIN_INTERVAL)),
+            max_interval=float(entry.get('max_interval', DAEMON_MAX_INTERVAL)),
+        ))
+    return searches
+
+@dataclass(order=True)
+class _Due:
+    at: float
+    order: int
+    search: Search = field(compare=False)
+
+class Scheduler:
+    # Hands out searches in the order they're due
+    def __init__(self, searches):
+        self._heap = [_Due(search.next_poll, order, search) for order, search in enumerate(searches)]
+        heapq.heapify(self._heap)
+        self._order = len(searches)
+
+    def next_due(self):
+        # Returns (search, seconds until it's due)
+        due = self._heap[0]
+        return due.search, max(0.0, due.at - time.time())
+
+    def pop(self):
+        return heapq.heappop(self._heap).search
+
+    def reschedule(self, search):
+        self._order += 1
+        heapq.heappush(self._heap, _Due(search.next_poll, self._order, search))
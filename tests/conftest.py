@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'pages')
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # A fresh database file for each test, opened through db.setup_db
+    path = str(tmp_path / 'test.db')
+    monkeypatch.setattr(db, 'DB_NAME', path)
+    return path
+
+def add_ads(writer, count, **fields):
+    # Buffers count synthetic car ads and returns their rows
+    values = {'price': 3000, 'negotiable': 'Negociabil', 'location': 'Cluj', 'date': '01-01-2025 12:00', 'size': 'N/A',
+              'age': 2012, 'kilometers': 150000, 'listing_type': 'car', **fields}
+    return [writer.insert_ad(f'Car {i}', f'https://www.olx.ro/d/oferta/car-{i}.html', **values) for i in range(count)]
+
+def saved_page(name):
+    # A page saved for the benchmarks, from benchmarks/pages
+    with open(os.path.join(PAGES_DIR, name), encoding='utf-8') as f:
+        return f.read()
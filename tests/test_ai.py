@@ -0,0 +1,46 @@
+import asyncio
+import time
+import ai
+
+class FakeCompletions:
+    async def create(self, **request):
+        return None
+
+class FakeLLM:
+    def __init__(self):
+        self.chat = type('Chat', (), {'completions': FakeCompletions()})()
+
+def test_cache_lookups_do_not_block_concurrent_ratings(monkeypatch):
+    def slow_lookup(request):
+        # A cache read stuck behind another process's write
+        time.sleep(0.2)
+        return 'key', None
+
+    monkeypatch.setattr(ai, 'build_rating_request', lambda listing, details, preferences: {})
+    monkeypatch.setattr(ai, '_lookup_cached_rating', slow_lookup)
+    monkeypatch.setattr(ai, '_store_rating', lambda key, result: None)
+    monkeypatch.setattr(ai, 'parse_rating_completion', lambda completion: (7.0, 'low', 'high'))
+
+    async def rate_all():
+        listings = [{'id': i} for i in range(4)]
+        return [pair async for pair in ai.rate_many(listings, [{}] * 4, None, llm=FakeLLM(), max_concurrency=4)]
+
+    start = time.perf_counter()
+    results = asyncio.run(rate_all())
+    assert len(results) == 4
+    # Run one after another the lookups would take 0.8 seconds
+    assert time.perf_counter() - start < 0.6
+
+def tool_call_completion(arguments):
+    function = type('Function', (), {'name': 'rate_car', 'arguments': arguments})()
+    message = type('Message', (), {'tool_calls': [type('ToolCall', (), {'function': function})()]})()
+    return type('Completion', (), {'choices': [type('Choice', (), {'message': message})()]})()
+
+def test_tool_call_arguments_are_parsed_as_json():
+    rating, low, high = ai.parse_rating_completion(tool_call_completion('{"rating": 8, "reasoning": "Fair price", "negotiable": true}'))
+    assert rating == 8
+    assert 'Fair price' in low + high
+
+def test_tool_call_arguments_are_not_evaluated():
+    result = ai.parse_rating_completion(tool_call_completion('__import__("os").getpid()'))
+    assert result[0] == 0
@@ -0,0 +1,39 @@
+import pytest
+import app
+import db
+from listing_parser import Card
+
+def card(name):
+    return Card(f'Car {name}', f'https://www.olx.ro/d/oferta/{name}.html', '3000', 'Negociabil', 'Cluj', '01-01-2025 12:00', age=2012)
+
+class BrokenCardsWriter(db.BatchWriter):
+    # Fails every ad whose URL marks it broken, the way a card with bad data would
+    def insert_ad(self, title, url, *args, **kwargs):
+        if 'broken' in url:
+            raise ValueError("bad card")
+        return super().insert_ad(title, url, *args, **kwargs)
+
+@pytest.fixture
+def scrape(database, monkeypatch):
+    # Runs scrape_listings in incremental mode over the given pages of cards
+    monkeypatch.setattr(app, 'conn', None)
+    monkeypatch.setattr(app, 'c', None)
+    monkeypatch.setattr(app, 'incremental', True)
+
+    def run(pages):
+        monkeypatch.setattr(app, 'fetch_page_cards', lambda pool, page, search_url=None: pages[page - 1])
+        conn, c = app.get_db()
+        try:
+            return app.scrape_listings(search_url='https://www.olx.ro/cars/?page=', page_count=len(pages),
+                                       writer=BrokenCardsWriter(conn))
+        finally:
+            db.close_db(conn)
+            app.conn = app.c = None
+    return run
+
+def test_incremental_run_stops_at_a_page_of_known_ads(scrape):
+    assert scrape([[card('a'), card('b')]]) == 2
+    assert scrape([[card('a'), card('b')], [card('c')]]) == 0
+
+def test_incremental_run_continues_past_a_page_of_failed_ads(scrape):
+    assert scrape([[card('broken-a'), card('broken-b')], [card('c')]]) == 1
@@ -0,0 +1,119 @@
+import sqlite3
+import pytest
+import db
+from conftest import add_ads
+
+def test_unrated_backlog_with_rollback_journal(database, monkeypatch):
+    # The backlog is read while the pipeline's writer commits ratings, which a rollback
+    # journal only allows when no read transaction is left open between chunks
+    monkeypatch.setattr(db, 'DB_JOURNAL_MODE', 'DELETE')
+    conn, c = db.setup_db()
+    with db.BatchWriter(conn) as writer:
+        add_ads(writer, 800)
+
+    writer_conn, _ = db.setup_db()
+    writer = db.BatchWriter(writer_conn, batch_size=50)
+    rated = 0
+    for listing in db.iter_unrated_listings(db_path=database):
+        writer.save_rating(listing['id'], 7.0, 'low', 'high')
+        rated += 1
+    writer.flush()
+
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    assert rated == 800
+    assert conn.execute('SELECT COUNT(*) FROM ai_ratings').fetchone()[0] == 800
+    db.close_db(writer_conn)
+    db.close_db(conn)
+
+def test_failed_flush_keeps_rows(database):
+    conn, c = db.setup_db()
+    conn.execute('PRAGMA busy_timeout=0')
+    writer = db.BatchWriter(conn, batch_size=1000)
+    add_ads(writer, 3)
+
+    # Another connection holding the write lock makes the flush fail
+    blocker, _ = db.setup_db()
+    blocker.execute('BEGIN IMMEDIATE')
+    with pytest.raises(sqlite3.OperationalError):
+        writer.flush()
+    blocker.rollback()
+    assert writer.pending == 3
+
+    writer.flush()
+    assert writer.pending == 0
+    assert conn.execute('SELECT COUNT(*) FROM advertisements').fetchone()[0] == 3
+    db.close_db(blocker)
+    db.close_db(conn)
+
+def test_deferred_writes_wait_for_flush(database):
+    conn, c = db.setup_db()
+    writer = db.BatchWriter(conn, batch_size=2)
+    with writer.deferred():
+        add_ads(writer, 5)
+    assert writer.pending == 5
+    assert conn.execute('SELECT COUNT(*) FROM advertisements').fetchone()[0] == 0
+
+    writer.flush()
+    assert conn.execute('SELECT COUNT(*) FROM advertisements').fetchone()[0] == 5
+    db.close_db(conn)
+
+def test_details_only_fill_missing_attributes(database):
+    conn, c = db.setup_db()
+    with db.BatchWriter(conn) as writer:
+        listing, = add_ads(writer, 1, age=2012, kilometers=150000)
+    with db.BatchWriter(conn) as writer:
+        writer.save_listing_details(listing['id'], {'description': '', 'parameters': {
+            'An de fabricatie': '2010', 'Rulaj': '210 000 km', 'Combustibil': 'Diesel',
+        }})
+
+    row = conn.execute('SELECT age, kilometers, fuel FROM advertisements WHERE id = ?', (listing['id'],)).fetchone()
+    assert row == (2012, 150000, 'diesel')
+    db.close_db(conn)
+
+def test_insert_ad_skips_known_urls(database):
+    conn, c = db.setup_db()
+    with db.BatchWriter(conn) as writer:
+        first, = add_ads(writer, 1)
+        assert add_ads(writer, 1) == [None]
+    with db.BatchWriter(conn) as writer:
+        assert add_ads(writer, 2)[0] is None
+
+    assert conn.execute('SELECT id FROM advertisements WHERE url = ?', (first['url'],)).fetchall() == [(first['id'],)]
+    assert conn.execute('SELECT COUNT(*) FROM advertisements').fetchone()[0] == 2
+    db.close_db(conn)
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_claim_listings_in_both_layouts(database, monkeypatch, compact):
+    monkeypatch.setattr(db, 'DB_COMPACT', compact)
+    conn, c = db.setup_db()
+    assert db.is_compact(conn) is compact
+    with db.BatchWriter(conn) as writer:
+        ads = add_ads(writer, 3)
+        writer.save_rating(ads[0]['id'], 7.0, 'low', 'high')
+    db.enqueue_unrated_listings(conn)
+
+    claimed = db.claim_listings(conn, 'test', 10, 60)
+    assert sorted(listing['id'] for listing in db.load_listings(conn, claimed)) == sorted(ad['id'] for ad in ads[1:])
+    db.close_db(conn)
+
+def test_layout_is_read_once_per_connection(database):
+    conn, c = db.setup_db()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    db.insert_ad(c, 'Car', 'https://www.olx.ro/d/oferta/car.html', 3000, '', '', '', '')
+    db.is_duplicate_ad(c, 'https://www.olx.ro/d/oferta/car.html')
+    assert not any('pragma_table_info' in statement for statement in statements)
+    db.close_db(conn)
+
+def test_compact_layout_compresses_only_long_reasoning(database, monkeypatch):
+    monkeypatch.setattr(db, 'DB_COMPACT', True)
+    conn, c = db.setup_db()
+    long_reasoning = 'Fair price for the year, but the mileage is high. ' * 20
+    with db.BatchWriter(conn) as writer:
+        ad = add_ads(writer, 1)[0]
+        writer.save_rating(ad['id'], 7.0, 'Cheap', long_reasoning)
+
+    stored = conn.execute('SELECT typeof(reasoning_low), typeof(reasoning_high) FROM ai_ratings').fetchone()
+    assert stored == ('text', 'blob')
+    assert db.get_rating(c, ad['id']) == (7.0, 'Cheap', long_reasoning)
+    db.close_db(conn)
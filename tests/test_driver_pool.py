@@ -0,0 +1,36 @@
+import pytest
+from web_drivers.driver_pool import DriverPool
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+
+    def execute_script(self, script):
+        return 1
+
+    def delete_all_cookies(self):
+        pass
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+def test_driver_is_reused_after_clean_use():
+    pool = DriverPool(FakeDriver)
+    with pool.driver() as first:
+        pass
+    with pool.driver() as second:
+        assert second is first
+    assert not first.quit_called
+
+def test_driver_is_discarded_when_the_task_fails():
+    pool = DriverPool(FakeDriver)
+    with pytest.raises(RuntimeError):
+        with pool.driver() as broken:
+            raise RuntimeError("page hung")
+    assert broken.quit_called
+
+    with pool.driver() as replacement:
+        assert replacement is not broken
@@ -0,0 +1,36 @@
+import random
+import pytest
+import db
+from filters import ListingFilters
+
+def fill_varied_ads(conn, count=300):
+    # Ads with every attribute sometimes missing, the way cards and older scrapes leave them
+    rng = random.Random(4)
+    maybe = lambda value: value if rng.random() > 0.2 else None
+    with db.BatchWriter(conn) as writer:
+        for i in range(count):
+            writer.insert_ad(f'Car {i}', f'https://www.olx.ro/d/oferta/car-{i}.html', maybe(str(rng.randrange(500, 20000))),
+                             'Fix', 'Cluj', '01-01-2025 12:00', 'N/A', maybe(rng.randrange(1995, 2025)),
+                             maybe(rng.randrange(0, 400000)), 'car', maybe(rng.choice(['Diesel', 'Benzina', 'Electric'])),
+                             maybe(rng.choice(['Manuala', 'Automata'])), maybe(f'{rng.randrange(60, 300)} CP'))
+
+@pytest.mark.parametrize('listing_filters', [
+    ListingFilters(),
+    ListingFilters(min_price=3000, max_price=9000),
+    ListingFilters(min_year=2010, max_kilometers=200000),
+    ListingFilters(min_horsepower=150, fuel_types=('Diesel',)),
+    ListingFilters(max_price=12000, fuel_types=('Benzina', 'Electric'), gearbox_types=('Automata',)),
+])
+def test_sql_and_python_filters_agree(database, listing_filters):
+    conn, c = db.setup_db()
+    fill_varied_ads(conn)
+    cursor = conn.execute('SELECT * FROM advertisements')
+    columns = [column[0] for column in cursor.description]
+    listings = [dict(zip(columns, row)) for row in cursor]
+
+    where, params = listing_filters.where()
+    in_sql = {row[0] for row in conn.execute(f'SELECT id FROM advertisements a WHERE {where}', params)}
+    in_python = {listing['id'] for listing in listings if listing_filters.matches(listing)}
+    assert in_sql == in_python
+    assert 0 < len(in_sql)
+    db.close_db(conn)
@@ -0,0 +1,44 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from web_drivers import http_session
+
+class Throttled(BaseHTTPRequestHandler):
+    status = 429
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        self.send_response(self.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class FakeLimiter:
+    def __init__(self):
+        self.penalized = []
+
+    def penalize(self, url, seconds=None):
+        self.penalized.append(url)
+
+@pytest.fixture
+def server():
+    Throttled.requests = 0
+    httpd = HTTPServer(('127.0.0.1', 0), Throttled)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}/'
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_throttled_response_penalizes_the_host(server, monkeypatch):
+    limiter = FakeLimiter()
+    monkeypatch.setattr(http_session, 'limiter', limiter)
+    monkeypatch.setattr(http_session, '_local', threading.local())
+
+    assert http_session.fetch_html(server) is None
+    # Not retried behind the limiter's back
+    assert Throttled.requests == 1
+    assert limiter.penalized == [server]
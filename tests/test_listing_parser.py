@@ -0,0 +1,22 @@
+import pytest
+import listing_parser
+from conftest import saved_page
+
+def fields(cards):
+    return [(card.title, card.url, card.price, card.negotiable, card.location, card.age, card.kilometers) for card in cards]
+
+@pytest.mark.parametrize('parser', [
+    'html.parser',
+    pytest.param('lxml', marks=pytest.mark.skipif(listing_parser.lxml_html is None, reason="lxml not installed")),
+])
+def test_rendered_cards_are_parsed(parser):
+    cards = listing_parser.parse_listing_cards(saved_page('olx_results_1.html'), parser, use_state=False)
+    assert len(cards) == 40
+    assert all(card.url.startswith('https://') for card in cards)
+    assert all(card.price and card.title for card in cards)
+
+@pytest.mark.skipif(listing_parser.lxml_html is None, reason="lxml not installed")
+def test_both_backends_read_the_same_cards():
+    html = saved_page('olx_results_2.html')
+    assert fields(listing_parser.parse_listing_cards(html, 'lxml', use_state=False)) == \
+        fields(listing_parser.parse_listing_cards(html, 'html.parser', use_state=False))
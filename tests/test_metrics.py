@@ -0,0 +1,13 @@
+import metrics
+
+def test_percentiles_cover_the_whole_run():
+    histogram = metrics.Histogram()
+    # A fast start followed by a much longer slow stretch
+    for _ in range(metrics.MAX_SAMPLES):
+        histogram.observe(0.1)
+    for _ in range(metrics.MAX_SAMPLES * 3):
+        histogram.observe(1.0)
+
+    assert len(histogram.samples) == metrics.MAX_SAMPLES
+    assert histogram.percentile(0.5) == 1.0
+    assert histogram.summary()['count'] == metrics.MAX_SAMPLES * 4
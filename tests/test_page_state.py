@@ -0,0 +1,49 @@
+import json
+import listing_parser
+import page_state
+from conftest import saved_page
+
+def olx_page(state, after=''):
+    literal = json.dumps(json.dumps(state))
+    return f'<html><head><script>window.__PRERENDERED_STATE__ = {literal};{after}</script></head><body></body></html>'
+
+def test_olx_state_is_read():
+    state = {'listing': {'listing': {'ads': [{'id': 1}]}}}
+    assert page_state.olx_state(olx_page(state)) == state
+
+def test_olx_state_ignores_statements_after_it():
+    state = {'listing': {'listing': {'ads': []}}}
+    html = olx_page(state, after='\n  window.__TAURUS_CONFIG__ = {"lang": "ro"};\n  window.dataLayer = [];')
+    assert page_state.olx_state(html) == state
+
+def test_missing_or_broken_state_is_none():
+    assert page_state.olx_state('<html><body></body></html>') is None
+    assert page_state.olx_state('<script>window.__PRERENDERED_STATE__ = "{broken";</script>') is None
+
+def test_saved_detail_pages_are_read_from_their_state():
+    olx = page_state.parse_details('olx', saved_page('olx_detail.html'))
+    assert olx['parameters']['Combustibil'] == 'Diesel'
+    assert olx['parameters']['seller_type'] == 'Persoana fizica'
+    assert olx['description'].startswith('Vand Volkswagen Golf')
+    assert '<' not in olx['description']
+
+    autovit = page_state.parse_details('autovit', saved_page('autovit_detail.html'))
+    assert autovit['parameters']['Putere'] == '105 CP'
+    assert 'ABS' in autovit['parameters']['Dotari']['Siguranta']
+
+    storia = page_state.parse_details('storia', saved_page('storia_detail.html'))
+    assert storia['parameters']['Numarul de camere'] == '2 camere'
+
+def test_pages_without_state_fall_back():
+    assert page_state.parse_details('olx', '<html><body><h1>Car</h1></body></html>') is None
+    assert page_state.parse_details('unknown', saved_page('olx_detail.html')) is None
+
+def test_cards_from_state_match_the_rendered_cards():
+    html = saved_page('olx_results_1.html')
+    from_state = listing_parser.parse_listing_cards(html, 'html.parser', use_state=True)
+    rendered = listing_parser.parse_listing_cards(html, 'html.parser', use_state=False)
+    assert [card.url for card in from_state] == [card.url for card in rendered]
+    assert [(card.price, card.age, card.kilometers) for card in from_state] == \
+        [(card.price, card.age, card.kilometers) for card in rendered]
+    # Attributes only the state has
+    assert all(card.fuel for card in from_state)
@@ -0,0 +1,94 @@
+import threading
+import time
+import ai
+import db
+import pipeline
+from conftest import add_ads
+
+def stored_ads(count):
+    conn, c = db.setup_db()
+    with db.BatchWriter(conn) as writer:
+        listings = add_ads(writer, count)
+    db.close_db(conn)
+    return listings
+
+def scraped_details(url):
+    return {'description': 'Car', 'parameters': {}}
+
+def rated(self, batch):
+    return [(7, 'low', 'high')] * len(batch)
+
+def test_listings_are_submitted_once(database, monkeypatch):
+    listing = stored_ads(1)[0]
+    monkeypatch.setattr(ai, 'scrape_detailed_data', scraped_details)
+    monkeypatch.setattr(pipeline.Pipeline, '_rate', rated)
+
+    rating = pipeline.Pipeline(ai.Preferences('cheap car'), llm=object(), use_prefilter=False)
+    rating.start()
+    assert rating.submit(listing)
+    assert not rating.submit(listing)
+    rating.close()
+    assert (rating.queued, rating.saved) == (1, 1)
+
+def test_dedupe_limit_forgets_the_oldest_listings(database):
+    a, b, c = stored_ads(3)
+    rating = pipeline.Pipeline(ai.Preferences('cheap car'), llm=object(), use_prefilter=False, dedupe_limit=2)
+    assert rating.submit(a) and rating.submit(b) and rating.submit(c)
+    # a was pushed out by c, b is still remembered
+    assert rating.submit(a)
+    assert not rating.submit(c)
+
+def test_failures_are_recorded_per_stage(database, monkeypatch):
+    blocked, unparsable, fine = stored_ads(3)
+
+    def scrape(url):
+        if url == blocked['url']:
+            raise RuntimeError("blocked")
+        return scraped_details(url)
+
+    def rate(self, batch):
+        return [(0, "Error: bad reply") if listing['id'] == unparsable['id'] else (7, 'low', 'high')
+                for listing, details in batch]
+
+    monkeypatch.setattr(ai, 'scrape_detailed_data', scrape)
+    monkeypatch.setattr(pipeline.Pipeline, '_rate', rate)
+    monkeypatch.setattr(pipeline, 'RATING_BATCH_WAIT', 0.01)
+
+    rating = pipeline.Pipeline(ai.Preferences('cheap car'), llm=object(), use_prefilter=False, run_id=3)
+    rating.start()
+    for listing in (blocked, unparsable, fine):
+        rating.submit(listing)
+    rating.close()
+    assert (rating.saved, rating.failed) == (1, 2)
+
+    conn, c = db.setup_db()
+    jobs = {key: row for key, *row in conn.execute("SELECT key, stage, status, attempts, last_error, run_id FROM jobs WHERE kind = 'listing'")}
+    assert jobs[blocked['id']] == ['details', 'failed', 1, 'blocked', 3]
+    assert jobs[unparsable['id']][:4] == ['rated', 'failed', 1, "Error: bad reply"]
+    assert db.get_rating(c, fine['id'])[0] == 7
+    db.close_db(conn)
+
+def test_offer_returns_while_rating_is_stalled(database, monkeypatch):
+    listings = stored_ads(20)
+    release = threading.Event()
+
+    def stalled_rate(self, batch):
+        release.wait(10)
+        return [(7, 'low', 'high')] * len(batch)
+
+    monkeypatch.setattr(ai, 'scrape_detailed_data', scraped_details)
+    monkeypatch.setattr(pipeline.Pipeline, '_rate', stalled_rate)
+    monkeypatch.setattr(pipeline, 'RATING_BATCH_WAIT', 0.01)
+
+    rating = pipeline.Pipeline(ai.Preferences('cheap car'), llm=object(), queue_size=1, use_prefilter=False)
+    rating.start()
+    try:
+        # Far more listings than the queues hold, submit() would block on the third or fourth
+        start = time.perf_counter()
+        for listing in listings:
+            rating.offer(listing)
+        assert time.perf_counter() - start < 1
+    finally:
+        release.set()
+        rating.close()
+    assert rating.saved == 20
@@ -0,0 +1,47 @@
+import pytest
+import rate_limiter
+from rate_limiter import DomainRateLimiter, TokenBucket
+
+class FakeClock:
+    # Sleeping only moves the clock forward, so tests see exact waits
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+def test_burst_then_refill_at_the_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire() == pytest.approx(0.5)
+    # Idle time refills the bucket, but never past its capacity
+    clock.now += 60
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire() == pytest.approx(0.5)
+
+def test_penalty_pauses_and_empties_the_bucket(clock):
+    bucket = TokenBucket(rate=1, burst=3)
+    bucket.penalize(10)
+    # Tokens only refill after the pause, so the full burst isn't available right away
+    assert bucket.acquire() == pytest.approx(11)
+    assert bucket.acquire() == pytest.approx(1)
+
+def test_zero_rate_never_waits(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    bucket.penalize(10)
+    assert [bucket.acquire() for _ in range(5)] == [0] * 5
+
+def test_hosts_are_limited_separately(clock):
+    limiter = DomainRateLimiter(rate=1, burst=1, penalty=30)
+    limiter.penalize('https://www.olx.ro/cars/?page=1')
+    assert limiter.wait('https://www.autovit.ro/autoturisme') == 0
+    assert limiter.wait('https://www.olx.ro/cars/?page=2') == pytest.approx(31)
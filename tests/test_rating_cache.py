@@ -0,0 +1,17 @@
+import ai
+import db
+import rating_cache
+
+def test_cache_connection_uses_the_database_pragmas(database):
+    cache = rating_cache.RatingCache(db_path=database)
+    conn, c = db.setup_db()
+    for pragma in ('busy_timeout', 'journal_mode', 'synchronous'):
+        assert cache.conn.execute(f'PRAGMA {pragma}').fetchone() == conn.execute(f'PRAGMA {pragma}').fetchone()
+    cache.close()
+    db.close_db(conn)
+
+def test_stats_lookup_does_not_open_the_cache(monkeypatch):
+    monkeypatch.setattr(rating_cache, 'LLM_CACHE_ENABLED', True)
+    monkeypatch.setattr(ai, '_rating_cache', None)
+    assert ai.get_rating_cache(create=False) is None
+    assert ai._rating_cache is None
@@ -0,0 +1,51 @@
+import json
+import pytest
+import scheduler
+from scheduler import Scheduler, Search
+
+def search(**fields):
+    return Search(**{'name': 'cars', 'url': 'https://www.olx.ro/cars/?page=', 'max_pages': 2,
+                     'min_interval': 300, 'max_interval': 3600, **fields})
+
+def test_first_poll_keeps_the_min_interval():
+    polled = search()
+    # The first poll finds the whole backlog, it doesn't speed the search up
+    assert polled.record_poll(500, now=1000) == 300
+    assert polled.next_poll == 1300
+
+def test_busy_search_is_clamped_to_the_min_interval(monkeypatch):
+    monkeypatch.setattr(scheduler, 'DAEMON_TARGET_NEW_ADS', 5)
+    polled = search()
+    polled.record_poll(0, now=1000)
+    assert polled.record_poll(600, now=1600) == 300
+
+def test_quiet_search_is_clamped_to_the_max_interval(monkeypatch):
+    monkeypatch.setattr(scheduler, 'DAEMON_TARGET_NEW_ADS', 5)
+    polled = search()
+    polled.record_poll(0, now=1000)
+    assert polled.record_poll(0, now=1300) == 3600
+    assert polled.record_poll(1, now=4900) == 3600
+
+def test_interval_follows_the_rate_between_the_bounds(monkeypatch):
+    monkeypatch.setattr(scheduler, 'DAEMON_TARGET_NEW_ADS', 5)
+    polled = search()
+    polled.record_poll(0, now=1000)
+    # 5 new ads in 1000 seconds: the next 5 are expected 1000 seconds later
+    assert polled.record_poll(5, now=2000) == pytest.approx(1000)
+
+def test_searches_come_due_in_order():
+    early, late = search(name='early', next_poll=10), search(name='late', next_poll=20)
+    due = Scheduler([late, early])
+    assert due.pop() is early
+    early.next_poll = 30
+    due.reschedule(early)
+    assert due.pop() is late
+
+def test_searches_file_overrides_the_bounds(tmp_path):
+    path = tmp_path / 'searches.json'
+    path.write_text(json.dumps([{'url': 'https://www.olx.ro/a/?page=', 'min_interval': 60}, {'url': 'https://www.olx.ro/b/?page='}]))
+    first, second = scheduler.load_searches(None, 3, path=str(path))
+    assert (first.name, first.min_interval, first.interval, first.max_pages) == ('search-1', 60, 60, 3)
+    assert second.min_interval == scheduler.DAEMON_MIN_INTERVAL
+    with pytest.raises(ValueError):
+        scheduler.load_searches(None, 3, path='')
@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+# Resolved driver binaries are remembered here so webdriver_manager's version lookups
+# (GitHub API calls) only happen once every DRIVER_CACHE_DAYS instead of per browser launch
+DRIVER_CACHE_FILE = os.path.expanduser(os.getenv('DRIVER_CACHE_FILE', '~/.cache/adsai/drivers.json'))
+DRIVER_CACHE_DAYS = float(os.getenv('DRIVER_CACHE_DAYS', '7'))
+
+# Offline mode never goes to the network: use the cached path, or a driver found on PATH
+DRIVER_OFFLINE = os.getenv('DRIVER_OFFLINE', 'false').lower() == 'true'
+
+_lock = threading.Lock()
+
+def _load():
+    try:
+        with open(DRIVER_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save(cache):
+    os.makedirs(os.path.dirname(DRIVER_CACHE_FILE) or '.', exist_ok=True)
+    # Write to a temporary file first so a crash can't leave a half-written cache
+    tmp_path = f'{DRIVER_CACHE_FILE}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, DRIVER_CACHE_FILE)
+
+def resolve_driver_path(name, install):
+    # name is the driver binary ('chromedriver', 'geckodriver'), install downloads it
+    # and returns its path (webdriver_manager's install())
+    with _lock:
+        entry = _load().get(name)
+        cached_path = entry['path'] if entry and os.path.exists(entry['path']) else None
+        if cached_path and (DRIVER_OFFLINE or time.time() - entry['resolved_at'] < DRIVER_CACHE_DAYS * 86400):
+            return cached_path
+
+        if DRIVER_OFFLINE:
+            path = cached_path or shutil.which(name)
+            if not path:
+                raise RuntimeError(f"DRIVER_OFFLINE is set but no cached {name} was found and none is on PATH")
+            return path
+
+        try:
+            path = install()
+        except Exception as e:
+            if cached_path:
+                print(f"Could not check for a newer {name} ({str(e)}), using the cached one")
+                return cached_path
+            raise
+
+        cache = _load()
+        cache[name] = {'path': path, 'resolved_at': time.time()}
+        try:
+            _save(cache)
+        except OSError as e:
+            print(f"Could not save driver cache: {str(e)}")
+        return path
@@ -0,0 +1,108 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+class DriverPool:
+    # Keeps a small set of long-lived WebDriver instances that are checked out
+    # and returned instead of launching a new browser for every page.
+    def __init__(self, factory, size=1, max_uses=50, on_discard=None):
+        self.factory = factory
+        # Called with each driver after it has been quit
+        self.on_discard = on_discard
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._uses = {}
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a free driver")
+
+        try:
+            # Reuse a warm driver if one is idle and still responsive
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self._is_healthy(driver):
+                    return driver
+                print("Discarding unresponsive driver from pool")
+                self._discard(driver)
+
+            driver = self.factory()
+            self._uses[id(driver)] = 0
+            return driver
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, driver, broken=False):
+        try:
+            uses = self._uses.get(id(driver), 0) + 1
+            self._uses[id(driver)] = uses
+
+            if broken or self._closed:
+                self._discard(driver)
+            elif self.max_uses and uses >= self.max_uses:
+                print(f"Recycling driver after {uses} uses")
+                self._discard(driver)
+            elif not self._reset(driver):
+                self._discard(driver)
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def driver(self, timeout=None):
+        driver = self.acquire(timeout=timeout)
+        try:
+            yield driver
+        except BaseException:
+            # The driver may have crashed or hung mid-page, don't hand it to the next task
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+    def _is_healthy(self, driver):
+        try:
+            return driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+    def _reset(self, driver):
+        # Clear cookies and storage so the next user starts from a clean state
+        try:
+            driver.delete_all_cookies()
+            try:
+                driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+            except Exception:
+                pass
+            driver.get('about:blank')
+            return True
+        except Exception as e:
+            print(f"Failed to reset driver: {str(e)}")
+            return False
+
+    def _discard(self, driver):
+        self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        if self.on_discard:
+            self.on_discard(driver)
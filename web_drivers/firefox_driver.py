@@ -1,7 +1,4 @@
-from selenium import webdriver
-from selenium.webdriver.firefox.service import Service
-from selenium.webdriver.firefox.options import Options
-from webdriver_manager.firefox import GeckoDriverManager
+from .driver_cache import resolve_driver_path
 
 def get_headers():
     return {
@@ -16,7 +13,12 @@ def get_headers():
         'DNT': '1'
     }
 
-def get_driver():
+def get_driver(lean=False, blocklist=(), profile_dir=None):
+    # Selenium and webdriver_manager are only imported once a browser is actually needed
+    from selenium import webdriver
+    from selenium.webdriver.firefox.service import Service
+    from selenium.webdriver.firefox.options import Options
+
     options = Options()
     options.add_argument('--headless')  # Run in headless mode
     options.add_argument("--no-sandbox")
@@ -29,9 +31,31 @@ def get_driver():
     options.add_argument('--disable-popup-blocking')
     options.add_argument('--disable-blink-features=AutomationControlled')
 
+    if profile_dir:
+        # Reuse the same profile between runs so the HTTP cache stays warm
+        options.add_argument('-profile')
+        options.add_argument(profile_dir)
+
+    if lean:
+        # We only read text from the DOM, so skip images, fonts and media and don't wait for subresources
+        options.page_load_strategy = 'eager'
+        options.set_preference('permissions.default.image', 2)
+        options.set_preference('browser.display.use_document_fonts', 0)
+        options.set_preference('gfx.downloadable_fonts.enabled', False)
+        options.set_preference('media.autoplay.default', 5)
+        options.set_preference('media.preload.default', 0)
+        # Built-in tracker blocking, plus blocklisted hosts resolved to localhost so they fail fast
+        options.set_preference('privacy.trackingprotection.enabled', True)
+        if blocklist:
+            options.set_preference('network.dns.localDomains', ','.join(blocklist))
+
     # Set up the Firefox driver with the webdriver manager
-    service = Service(GeckoDriverManager().install())
+    service = Service(resolve_driver_path('geckodriver', _install_driver))
     driver = webdriver.Firefox(service=service, options=options)
     driver.set_page_load_timeout(30)  # Set page load timeout
 
-    return driver
\ No newline at end of file
+    return driver
+
+def _install_driver():
+    from webdriver_manager.firefox import GeckoDriverManager
+    return GeckoDriverManager().install()
@@ -0,0 +1,55 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import web_driver
+import metrics
+from rate_limiter import limiter
+
+# HTTP fetch settings
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '15'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+
+# Sessions aren't guaranteed thread safe, so each thread keeps its own keep-alive session
+_local = threading.local()
+
+def create_session():
+    session = requests.Session()
+
+    headers = web_driver.get_headers()
+    # requests can't decode brotli without an extra package
+    headers['Accept-Encoding'] = 'gzip, deflate'
+    session.headers.update(headers)
+
+    # 429 isn't retried here, it goes back to fetch_html so the rate limiter backs off the host.
+    # Once retries run out the last response is returned rather than raised, for the same reason.
+    retry = Retry(total=2, backoff_factor=1, status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def get_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = create_session()
+        _local.session = session
+    return session
+
+def fetch_html(url, timeout=HTTP_TIMEOUT):
+    # Returns the page HTML, or None if the request failed
+    try:
+        with metrics.timer('http_fetch'):
+            response = get_session().get(url, timeout=timeout)
+        metrics.increment('http_bytes', len(response.content))
+        if response.status_code != 200:
+            print(f"HTTP {response.status_code} for {url}")
+            if response.status_code in (403, 429):
+                # Throttled, slow down every request to this host
+                limiter.penalize(url)
+            return None
+        return response.text
+    except requests.RequestException as e:
+        print(f"HTTP request failed for {url}: {str(e)}")
+        return None
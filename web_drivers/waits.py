@@ -0,0 +1,10 @@
+from selenium.webdriver.support.ui import WebDriverWait
+import metrics
+
+# Kept apart from web_driver so importing the pool doesn't load Selenium
+
+class TimedWait(WebDriverWait):
+    # WebDriverWait that records how long each wait takes, including ones that time out
+    def until(self, method, message=""):
+        with metrics.timer('element_wait'):
+            return super().until(method, message)
@@ -1,7 +1,10 @@
 import os
+import threading
 from dotenv import load_dotenv
 from . import firefox_driver
 from . import chrome_driver
+from .driver_pool import DriverPool
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -9,12 +12,94 @@ load_dotenv()
 # Get browser preference from environment variables
 USE_CHROME = os.getenv('USE_CHROME', 'false').lower() == 'true'
 
+# Driver pool settings. Unset, the pool has a browser for each detail worker and each
+# results page fetched at once (DETAIL_WORKERS and SCRAPE_WORKERS, read with their defaults)
+DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE')
+                       or int(os.getenv('DETAIL_WORKERS', '1')) + int(os.getenv('SCRAPE_WORKERS', '2')))
+DRIVER_MAX_USES = int(os.getenv('DRIVER_MAX_USES', '50'))
+
+# 'lean' skips images, fonts, media and ad/analytics hosts and returns pages once the DOM
+# is ready, 'full' loads everything like a normal browser
+BROWSER_PROFILE = os.getenv('BROWSER_PROFILE', 'lean').lower()
+
+# Hosts blocked by the lean profile (Firefox matches them exactly, Chrome also blocks subdomains)
+DEFAULT_BLOCKLIST = ','.join([
+    'googletagmanager.com', 'www.googletagmanager.com',
+    'google-analytics.com', 'www.google-analytics.com',
+    'securepubads.g.doubleclick.net', 'stats.g.doubleclick.net',
+    'pagead2.googlesyndication.com', 'tpc.googlesyndication.com',
+    'connect.facebook.net', 'static.hotjar.com', 'script.hotjar.com',
+    'static.criteo.net', 'ib.adnxs.com', 'sb.scorecardresearch.com',
+])
+BROWSER_BLOCKLIST = [host.strip() for host in os.getenv('BROWSER_BLOCKLIST', DEFAULT_BLOCKLIST).split(',') if host.strip()]
+
+# Directory for persistent browser profiles (keeps the HTTP cache between runs), empty
+# for a throwaway profile per browser. Each open browser gets its own subdirectory.
+BROWSER_PROFILE_DIR = os.getenv('BROWSER_PROFILE_DIR', '')
+
+# document.readyState values that count as loaded, eager loading returns at 'interactive'
+READY_STATES = ('interactive', 'complete') if BROWSER_PROFILE == 'lean' else ('complete',)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Profile subdirectory index used by each open browser, two browsers can't share one profile
+_profile_slots = {}
+_profile_slots_in_use = set()
+_profile_lock = threading.Lock()
+
 def get_headers():
     if USE_CHROME:
         return chrome_driver.get_headers()
     return firefox_driver.get_headers()
 
-def get_driver():
-    if USE_CHROME:
-        return chrome_driver.get_driver()
-    return firefox_driver.get_driver()
\ No newline at end of file
+def get_driver(profile=None):
+    browser = 'chrome' if USE_CHROME else 'firefox'
+    profile = profile or BROWSER_PROFILE
+    slot, profile_dir = _claim_profile_dir(browser)
+    try:
+        with metrics.timer('driver_launch', browser=browser, profile=profile):
+            driver_module = chrome_driver if USE_CHROME else firefox_driver
+            driver = driver_module.get_driver(lean=profile == 'lean', blocklist=BROWSER_BLOCKLIST, profile_dir=profile_dir)
+    except Exception:
+        _release_profile_slot(slot)
+        raise
+    if slot is not None:
+        _profile_slots[id(driver)] = slot
+    return driver
+
+def _claim_profile_dir(browser):
+    if not BROWSER_PROFILE_DIR:
+        return None, None
+    with _profile_lock:
+        slot = 0
+        while slot in _profile_slots_in_use:
+            slot += 1
+        _profile_slots_in_use.add(slot)
+    profile_dir = os.path.abspath(os.path.join(BROWSER_PROFILE_DIR, f'{browser}-{slot}'))
+    os.makedirs(profile_dir, exist_ok=True)
+    return slot, profile_dir
+
+def _release_profile_slot(slot):
+    if slot is not None:
+        with _profile_lock:
+            _profile_slots_in_use.discard(slot)
+
+def release_driver_profile(driver):
+    # Frees the driver's profile directory for the next browser once it has quit
+    _release_profile_slot(_profile_slots.pop(id(driver), None))
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool(get_driver, size=DRIVER_POOL_SIZE, max_uses=DRIVER_MAX_USES,
+                               on_discard=release_driver_profile)
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,97 @@
+import os
+import socket
+import threading
+import time
+import db
+import pipeline
+import prefilter
+
+# Rating worker for the shared work queue. Any number of `python app.py worker` processes,
+# on this machine or others sharing the database file, claim unrated listings with a
+# lease, scrape their details and rate them through the usual pipeline stages.
+# A worker renews its leases while it runs, so listings are only picked up by another
+# worker once it has died and its leases have expired.
+
+# Listings claimed at a time, more are claimed as the pipeline takes them
+WORKER_BATCH_SIZE = int(os.getenv('WORKER_BATCH_SIZE', '4'))
+
+# Seconds a claimed listing stays leased without a heartbeat
+WORKER_LEASE_SECONDS = float(os.getenv('WORKER_LEASE_SECONDS', '300'))
+
+# Seconds to wait before looking again when there's nothing to claim
+WORKER_POLL_SECONDS = float(os.getenv('WORKER_POLL_SECONDS', '30'))
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class Heartbeat:
+    # Renews this worker's leases every third of the lease time, on its own connection
+    def __init__(self, owner, lease_seconds=WORKER_LEASE_SECONDS):
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        conn, c = db.setup_db()
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                try:
+                    db.renew_leases(conn, self.owner, self.lease_seconds)
+                except Exception as e:
+                    print(f"Could not renew leases: {str(e)}")
+        finally:
+            conn.close()
+
+def run_worker(preferences, listing_filters=None, once=False):
+    # Claims and rates listings until interrupted, or until nothing is left with once
+    owner = worker_id()
+    conn, c = db.setup_db()
+    run_id, _ = db.start_run(conn)
+    status = 'failed'
+    print(f"Worker {owner} started")
+    if prefilter.enabled():
+        print("The pre-filter needs every listing at once, queue workers rate listings without it")
+
+    # The lease is what keeps listings from being processed twice, so a listing that
+    # failed can come back to the same worker on a later claim
+    rating_pipeline = pipeline.Pipeline(preferences, listing_filters=listing_filters, run_id=run_id,
+                                        use_prefilter=False, dedupe=False)
+    heartbeat = Heartbeat(owner)
+    rating_pipeline.start()
+    heartbeat.start()
+    try:
+        while True:
+            claimed = db.claim_listings(conn, owner, WORKER_BATCH_SIZE, WORKER_LEASE_SECONDS, listing_filters)
+            if not claimed and db.enqueue_unrated_listings(conn):
+                # Listings from before the work queue existed, try again now they have job rows
+                continue
+            if not claimed:
+                if once:
+                    print("No listings left to claim")
+                    break
+                time.sleep(WORKER_POLL_SECONDS)
+                continue
+
+            print(f"Claimed {len(claimed)} listings")
+            for listing in db.load_listings(conn, claimed):
+                # Blocks while the pipeline is busy, the heartbeat keeps the lease alive meanwhile
+                rating_pipeline.submit(listing)
+        status = 'finished'
+    except KeyboardInterrupt:
+        status = 'interrupted'
+        raise
+    finally:
+        rating_pipeline.close()
+        heartbeat.stop()
+        # Anything still leased (filtered out, or never started) is handed back
+        db.release_leases(conn, owner)
+        db.finish_run(conn, run_id, status)
+        db.close_db(conn)